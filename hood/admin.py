@@ -1,9 +1,33 @@
 from django.contrib import admin
-from .models import Profile, Hood, Location, Business, News
+from .models import Profile, Hood, HoodStats, Location, Business, News, OutgoingEmail, ImageJob, ServicePoint
+
+
+class HoodAdmin(admin.ModelAdmin):
+    list_display = ('hood_name', 'hood_location', 'members', 'posts', 'businesses')
+    list_select_related = ('hood_location', 'stats')
+
+    def stat(self, hood, field):
+        try:
+            return getattr(hood.stats, field)
+        except HoodStats.DoesNotExist:
+            return None
+
+    def members(self, hood):
+        return self.stat(hood, 'stats_members')
+
+    def posts(self, hood):
+        return self.stat(hood, 'stats_posts')
+
+    def businesses(self, hood):
+        return self.stat(hood, 'stats_businesses')
+
 
 # Register your models here.
 admin.site.register(Profile)
-admin.site.register(Hood)
+admin.site.register(Hood, HoodAdmin)
 admin.site.register(Location)
 admin.site.register(Business)
-admin.site.register(News)
\ No newline at end of file
+admin.site.register(News)
+admin.site.register(OutgoingEmail)
+admin.site.register(ImageJob)
+admin.site.register(ServicePoint)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class HoodConfig(AppConfig):
     name = 'hood'
+
+    def ready(self):
+        from . import checks  # noqa: F401
@@ -0,0 +1,16 @@
+from django.contrib.auth.backends import ModelBackend
+from .models import Profile
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Authentication backend that loads a session's user together with their profile, hood and
+    location from the cache, so HoodProfileMiddleware has request.profile without a query
+    """
+    def get_user(self, user_id):
+        profile = Profile.find_cached_profile(user_id)
+        if profile is None:
+            return super().get_user(user_id)
+        user = profile.profile_owner
+        user._request_profile = profile
+        return user if self.user_can_authenticate(user) else None
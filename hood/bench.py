@@ -0,0 +1,322 @@
+import hashlib
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+import django
+from googlemaps import Client
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client as HttpClient, override_settings
+from . import maps, views
+from .cache import bump_version
+from .geo import geohash_encode
+from .models import Profile, Hood, HoodStats, Location, Business, News, ServicePoint
+
+BENCH_PASSWORD = 'bench-pass-123'
+# seeded hoods are geocoded to points within about 15km of this one
+ORIGIN = (-1.29, 36.82)
+SPREAD = 0.15
+
+
+def stub_point(name):
+    """
+    function that places a name at a fixed point around ORIGIN, so reruns geocode the same way
+    """
+    digest = hashlib.md5(name.encode()).digest()
+    return (ORIGIN[0] + (digest[0] / 255 - 0.5) * 2 * SPREAD,
+            ORIGIN[1] + (digest[1] / 255 - 0.5) * 2 * SPREAD)
+
+
+class StubMapsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith('/geocode/json'):
+            lat, lng = stub_point(query.get('address', [''])[0])
+            body = {'status': 'OK', 'results': [{'geometry': {'location': {'lat': lat, 'lng': lng}}}]}
+        elif url.path.endswith('/nearbysearch/json'):
+            lat, lng = (float(value) for value in query['location'][0].split(','))
+            kind = query.get('type', ['place'])[0]
+            body = {'status': 'OK', 'results': [
+                {'place_id': 'stub-{}-{:.3f}-{:.3f}-{}'.format(kind, lat, lng, number),
+                 'name': 'Stub {} {}'.format(kind, number), 'vicinity': 'Stub Road',
+                 'geometry': {'location': {'lat': lat + number * 0.002, 'lng': lng}}}
+                for number in range(self.server.places)]}
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubMapsServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the geocode and places apis that answers each request after latency seconds
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, places=20):
+        super().__init__(('127.0.0.1', 0), StubMapsHandler)
+        self.latency = latency
+        self.places = places
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_port)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class StubClient(Client):
+    """
+    googlemaps client that sends every request to the stub server instead of google
+    """
+    def __init__(self, base_url, **kwargs):
+        super().__init__(key='AIzaBenchmarkStubKey', **kwargs)
+        self.base_url = base_url
+
+    def _request(self, url, params, first_request_time=None, retry_counter=0, base_url=None, *args, **kwargs):
+        return super()._request(url, params, first_request_time, retry_counter, self.base_url, *args, **kwargs)
+
+
+@contextmanager
+def stub_maps(server):
+    """
+    context manager that points geocode and places lookups at a stub server
+    """
+    gmaps = maps._gmaps
+    maps._gmaps = StubClient(server.url, timeout=10)
+    maps.get_nearby_cache().clear()
+    try:
+        with override_settings(GEOCODE_URL=server.url + '/maps/api/geocode/json?address={}&key={}'):
+            yield
+    finally:
+        maps._gmaps = gmaps
+        maps.get_nearby_cache().clear()
+
+
+def volumes():
+    """
+    function that counts the bench data set present, members, seeded news and businesses per hood
+    """
+    hoods = Hood.objects.filter(hood_name__startswith='bench-hood-')
+    count = hoods.count()
+
+    def per_hood(queryset):
+        if not count:
+            return 0
+        total = queryset.count()
+        return total // count if total % count == 0 else round(total / count, 2)
+
+    return OrderedDict([
+        ('hoods', count),
+        ('members', per_hood(Profile.objects.filter(profile_hood__in=hoods))),
+        # posts made by the post flow aren't part of the seeded volumes
+        ('news', per_hood(News.objects.filter(news_hood__in=hoods, news_details__startswith='Bench news '))),
+        ('businesses', per_hood(Business.objects.filter(business_hood__in=hoods))),
+        ('service_points', ServicePoint.objects.filter(service_place_id__startswith='bench-service-').count()),
+    ])
+
+
+def seed(hoods=10, members=20, news=50, businesses=20, service_points=20):
+    """
+    function that creates a reproducible data set of bench-* hoods, reusing the one already seeded when
+    its volumes match and clearing it first when they don't
+    Locations are saved one by one so they geocode against the stub, everything else is bulk created.
+    Returns:
+        the seeded members as (username, hood id, hood name, location id) tuples
+    """
+    rng = random.Random(0)
+    names = ['bench-hood-{}'.format(number) for number in range(hoods)]
+    present = volumes()
+    if [present[field] for field in ('hoods', 'members', 'news', 'businesses')] != [hoods, members, news, businesses]:
+        # deleting the members takes the hoods they run, with their news, businesses and stats
+        User.objects.filter(username__startswith='bench-hood-').delete()
+        Location.objects.filter(loc_name__startswith='bench-location-').delete()
+        password = make_password(BENCH_PASSWORD)
+        locations = [Location(loc_name='bench-location-{}'.format(number)) for number in range(hoods)]
+        for location in locations:
+            location.save()
+        User.objects.bulk_create([User(username='{}-member-{}'.format(name, number), password=password)
+                                  for name in names for number in range(members)])
+        user_ids = dict(User.objects.filter(username__startswith='bench-hood-').values_list('username', 'id'))
+        Profile.objects.bulk_create([Profile(profile_owner_id=user_id, profile_id='12345678', email_confirmed=True)
+                                     for user_id in user_ids.values()])
+        profile_ids = dict(Profile.objects.filter(profile_owner__in=user_ids.values()).values_list(
+            'profile_owner__username', 'id'))
+
+        for name, location in zip(names, locations):
+            usernames = ['{}-member-{}'.format(name, number) for number in range(members)]
+            owners = [profile_ids[username] for username in usernames]
+            hood = Hood.objects.create(hood_name=name, hood_location=location, hood_admin_id=owners[0])
+            Profile.objects.filter(id__in=owners).update(profile_hood=hood)
+            News.objects.bulk_create([
+                News(news_details='Bench news {} from {}'.format(number, name),
+                     news_created_by_id=rng.choice(owners), news_hood=hood) for number in range(news)])
+            Business.objects.bulk_create([
+                Business(business_name='Bench business {}'.format(number),
+                         business_category=rng.choice(Business.BUSINESS_CHOICES)[0],
+                         business_owner_id=rng.choice(owners), business_hood=hood,
+                         business_email='business{}@bench.hood'.format(number)) for number in range(businesses)])
+            bump_version('hood-feed', hood.id)
+            bump_version('hood-businesses', hood.id)
+        HoodStats.reconcile(Hood.objects.filter(hood_name__in=names).values_list('id', flat=True))
+
+    if present['service_points'] != service_points:
+        ServicePoint.objects.filter(service_place_id__startswith='bench-service-').delete()
+        points = []
+        for number in range(service_points):
+            lat, lng = stub_point('bench-service-{}'.format(number))
+            points.append(ServicePoint(service_name='Bench service {}'.format(number),
+                                       service_kind=('police', 'hospital')[number % 2], service_lat=lat,
+                                       service_lng=lng, service_geohash=geohash_encode(lat, lng),
+                                       service_place_id='bench-service-{}'.format(number)))
+        ServicePoint.objects.bulk_create(points)
+        bump_version('service-points', 'all')
+
+    seeded = Profile.objects.filter(profile_hood__hood_name__in=names).order_by('id').values_list(
+        'profile_owner__username', 'profile_hood', 'profile_hood__hood_name', 'profile_hood__hood_location')
+    return list(seeded)
+
+
+def ajax(client_method, path, data):
+    return client_method(path, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+
+# the main flows, each driving one request as a logged in member
+FLOWS = OrderedDict([
+    ('login', lambda client, member: client.post(reverse('login'), {'username': member[0],
+                                                                    'password': BENCH_PASSWORD})),
+    ('index', lambda client, member: client.get(reverse(views.index))),
+    ('post', lambda client, member: client.post(reverse(views.post), {'news_details': 'Bench post'})),
+    ('all_business', lambda client, member: client.get(reverse(views.all_business))),
+    ('load_hood', lambda client, member: ajax(client.get, reverse(views.load_hood),
+                                              {'hood_location': member[3]})),
+    ('check_location_exists', lambda client, member: ajax(client.post, reverse(views.check_location_exists),
+                                                          {'hood-name': member[2]})),
+])
+
+
+def percentile(ordered, percent):
+    """
+    function that returns the nearest rank percentile of sorted values
+    """
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, wall_seconds):
+    """
+    function that summarises (seconds, queries, error) samples
+    """
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = [count for _, count, _ in samples if count is not None]
+    errors = [error for _, _, error in samples if error is not None]
+    summary = OrderedDict([
+        ('requests', len(samples)),
+        ('errors', len(errors)),
+        ('error_samples', sorted(set(errors))[:3]),
+        ('throughput_rps', round(len(samples) / wall_seconds, 2) if wall_seconds else None),
+    ])
+    if latencies:
+        summary['latency_ms'] = OrderedDict(
+            [('p{}'.format(percent), round(percentile(latencies, percent), 2)) for percent in (50, 90, 95, 99)] +
+            [('max', round(latencies[-1], 2)), ('mean', round(sum(latencies) / len(latencies), 2))])
+    if queries:
+        summary['queries_per_request'] = OrderedDict([('mean', round(sum(queries) / len(queries), 2)),
+                                                      ('max', max(queries))])
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark:
+    """
+    Benchmark that drives flows as concurrent members through the whole middleware stack
+    Each worker logs in as its own member with a test client, then runs every flow in order for
+    each iteration. Queries per request come from the metrics middleware.
+    """
+    def __init__(self, members, flows=tuple(FLOWS), concurrency=8, iterations=20):
+        self.members = members
+        self.flows = flows
+        self.concurrency = concurrency
+        self.iterations = iterations
+        self.samples = {name: [] for name in flows}
+        self.lock = threading.Lock()
+
+    def run(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            list(pool.map(self.worker, range(self.concurrency)))
+        wall_seconds = time.perf_counter() - start
+
+        every_sample = [sample for name in self.flows for sample in self.samples[name]]
+        return OrderedDict([
+            ('commit', git_commit()),
+            ('environment', OrderedDict([('python', platform.python_version()), ('django', django.get_version()),
+                                         ('database', connection.vendor)])),
+            ('concurrency', self.concurrency),
+            ('iterations', self.iterations),
+            ('wall_seconds', round(wall_seconds, 3)),
+            ('total', summarize(every_sample, wall_seconds)),
+            ('flows', OrderedDict((name, summarize(self.samples[name], wall_seconds)) for name in self.flows)),
+        ])
+
+    def worker(self, number):
+        member = self.members[number % len(self.members)]
+        client = HttpClient()
+        try:
+            if 'login' not in self.flows:
+                client.force_login(User.objects.get(username=member[0]))
+            for _ in range(self.iterations):
+                for name in self.flows:
+                    self.measure(name, client, member)
+        finally:
+            # every worker thread opened its own connection
+            connection.close()
+
+    def measure(self, name, client, member):
+        queries = error = None
+        start = time.perf_counter()
+        try:
+            response = FLOWS[name](client, member)
+        except Exception as exception:
+            error = '{}: {}'.format(type(exception).__name__, exception)
+        else:
+            if response.status_code >= 400:
+                error = 'HTTP {}'.format(response.status_code)
+            stats = getattr(response.wsgi_request, 'metrics', None)
+            queries = len(stats.queries) if stats is not None else None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.samples[name].append((elapsed, queries, error))
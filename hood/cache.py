@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# backends whose entries every process sees and whose incr is atomic
+SHARED_CACHE_BACKENDS = ('memcached', 'redis')
+
+
+class TTLCache:
+    """
+    Thread safe in-process cache with a time to live, LRU eviction and stale-while-revalidate
+
+    Entries younger than ttl are served as they are. Entries older than ttl but younger than
+    ttl + stale_ttl are still served while a background thread reloads them, anything older
+    is reloaded inline. Concurrent misses for a key share one load, and a load that fails is
+    raised again to callers for failure_ttl seconds instead of being retried.
+    """
+    def __init__(self, maxsize, ttl, stale_ttl=0, failure_ttl=0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.failure_ttl = failure_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._failures = {}
+        self._loading = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """
+        True while key holds a fresh or stale value, or a recent failure, that get_or_load can
+        answer without loading
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[1] < self.ttl + self.stale_ttl:
+                return True
+            return self._recent_failure(key) is not None
+
+    def get(self, key):
+        """
+        method that returns a fresh or stale cached value, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, loaded_at = entry
+            if self.clock() - loaded_at >= self.ttl + self.stale_ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        method that stores a value, evicting the least recently used entries past maxsize
+        """
+        with self._lock:
+            self._failures.pop(key, None)
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._failures.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._failures.clear()
+
+    def get_or_load(self, key, loader):
+        """
+        method that returns the cached value for key, calling loader() to fill or refresh it
+        """
+        with self._lock:
+            stale = False
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                value, loaded_at = entry
+                age = self.clock() - loaded_at
+                if age < self.ttl:
+                    return value
+                stale = age < self.ttl + self.stale_ttl
+            if not stale:
+                failure = self._recent_failure(key)
+                if failure is not None:
+                    raise failure
+                future = self._loading.get(key)
+                loading = future is None
+                if loading:
+                    future = self._loading[key] = Future()
+
+        if stale:
+            self._refresh_in_background(key, loader)
+            return value
+        if not loading:
+            # another thread is already loading this key
+            return future.result()
+
+        try:
+            value = loader()
+        except Exception as error:
+            if self.failure_ttl:
+                with self._lock:
+                    self._failures[key] = (error, self.clock())
+            future.set_exception(error)
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    def _recent_failure(self, key):
+        # called with the lock held
+        failure = self._failures.get(key)
+        if failure is None:
+            return None
+        if self.clock() - failure[1] >= self.failure_ttl:
+            del self._failures[key]
+            return None
+        return failure[0]
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.set(key, loader())
+            except Exception:
+                # keep serving the stale value, the next request past ttl retries
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+def shared_cache_warning():
+    """
+    function that returns a warning when the default cache isn't shared between processes with an
+    atomic incr, or None
+    Versions bumped in one process's memory never reach the others, and a backend whose incr is a
+    get then a set can lose one of two concurrent bumps
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if any(name in backend.lower() for name in SHARED_CACHE_BACKENDS):
+        return None
+    return ('The {} cache backend is not shared between processes with an atomic incr, so cached feeds, '
+            'directories and profiles go stale across workers; set CACHE_BACKEND to a memcached or redis '
+            'backend'.format(backend.rsplit('.', 1)[-1]))
+
+
+def version_key(namespace, key):
+    return 'version:{}:{}'.format(namespace, key)
+
+
+def get_version(namespace, key):
+    """
+    function that returns the current version of a cached object, e.g. a hood's feed
+    Versions start from the clock so a counter evicted from the cache never comes back at a
+    number that older entries were stored under
+    """
+    return cache.get_or_set(version_key(namespace, key), lambda: int(time.time() * 1000), None)
+
+
+def get_versions(keys):
+    """
+    function that returns the current versions of several (namespace, key) objects in one cache
+    round trip, with None for versions that aren't set
+    """
+    found = cache.get_many([version_key(namespace, key) for namespace, key in keys])
+    return [found.get(version_key(namespace, key)) for namespace, key in keys]
+
+
+def bump_version(namespace, key):
+    """
+    function that invalidates every entry stored under the current version of an object
+    """
+    try:
+        cache.incr(version_key(namespace, key))
+    except ValueError:
+        cache.set(version_key(namespace, key), int(time.time() * 1000), None)
+
+
+def bump_version_on_commit(namespace, key):
+    """
+    function that bumps a version once the current transaction commits, so readers can't cache
+    the old rows under the new version
+    """
+    transaction.on_commit(lambda: bump_version(namespace, key))
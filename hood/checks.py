@@ -0,0 +1,14 @@
+from django.core.checks import Warning, register
+from .cache import shared_cache_warning
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    check that warns when versioned cache entries can't be invalidated across processes
+    """
+    warning = shared_cache_warning()
+    if warning is None:
+        return []
+    return [Warning(warning, hint='e.g. CACHE_BACKEND=django.core.cache.backends.memcached.PyLibMCCache '
+                                  'and CACHE_LOCATION=host:11211', id='hood.W001')]
@@ -1,11 +1,10 @@
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from .models import Profile
 
 def user_belongs_to_hood(function):
     def wrap(request, *args, **kwargs):
-        profile = Profile.objects.get(profile_owner=request.user)
+        profile = request.profile
         if not profile.profile_hood_id:
             messages.info(request, 'Kindly join or create a neighbourhood to continue')
             return redirect(reverse('new_location'))
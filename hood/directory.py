@@ -0,0 +1,209 @@
+import csv
+import json
+from itertools import islice
+from django.db import transaction
+from .cache import bump_version
+from .models import Profile, Hood, HoodStats, Location, Business
+
+# columns of each record type, in the order exports write them
+FIELDS = {
+    'location': ('name', 'lat', 'lng'),
+    'hood': ('name', 'location', 'admin'),
+    'business': ('name', 'category', 'hood', 'owner', 'email', 'description'),
+}
+# record types in the order a chunk is written so hoods can use locations from the same chunk
+TYPE_ORDER = ('location', 'hood', 'business')
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(stream, file_format, record_type=None):
+    """
+    function that lazily reads (line number, record) pairs from a csv or jsonl stream
+    Records without a type column get record_type
+    """
+    if file_format == 'csv':
+        rows = csv.DictReader(stream)
+        start = 2
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+        start = 1
+    for line, row in enumerate(rows, start):
+        row = {key: value for key, value in row.items() if value not in (None, '')}
+        row.setdefault('type', record_type)
+        yield line, row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class DirectoryImporter:
+    """
+    Importer that bulk creates locations, hoods and businesses from records
+    Foreign keys are resolved by name through in-memory indexes loaded once up front, and each
+    chunk of records is written with one bulk_create per type inside a single transaction.
+    bulk_create skips save() and signals, so locations are geocoded by the geocode_locations
+    command and cached directories are expired once at the end.
+    """
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.created = {record_type: 0 for record_type in TYPE_ORDER}
+        self.errors = []
+        self.touched_hoods = set()
+        self.locations = dict(Location.objects.values_list('loc_name', 'id'))
+        self.profiles = dict(Profile.objects.values_list('profile_owner__username', 'id'))
+        self.hoods = {}
+        self.hood_keys = set()
+        for hood_id, name, location_id in Hood.objects.values_list('id', 'hood_name', 'hood_location_id'):
+            self.index_hood(hood_id, name, location_id)
+
+    def index_hood(self, hood_id, name, location_id):
+        # hood names aren't unique, a name used by two hoods can't be resolved
+        self.hoods[name] = None if name in self.hoods else hood_id
+        self.hood_keys.add((name, location_id))
+
+    def run(self, records):
+        for chunk in chunked(records, self.chunk_size):
+            with transaction.atomic():
+                self.import_chunk(chunk)
+        self.finish()
+        return self.created, self.errors
+
+    def import_chunk(self, chunk):
+        by_type = {record_type: [] for record_type in TYPE_ORDER}
+        for line, record in chunk:
+            if record.get('type') not in by_type:
+                self.errors.append((line, 'unknown record type {!r}'.format(record.get('type'))))
+            else:
+                by_type[record['type']].append((line, record))
+
+        for record_type in TYPE_ORDER:
+            build = getattr(self, 'build_' + record_type)
+            instances = []
+            for line, record in by_type[record_type]:
+                try:
+                    instance = build(record)
+                except (RecordError, KeyError, ValueError) as error:
+                    self.errors.append((line, str(error)))
+                else:
+                    if instance is not None:
+                        instances.append(instance)
+            if instances:
+                getattr(self, 'create_' + record_type)(instances)
+                self.created[record_type] += len(instances)
+
+    def build_location(self, record):
+        name = self.required(record, 'name')
+        if name in self.locations:
+            return None
+        # reserve the name so repeats within the chunk aren't created twice
+        self.locations[name] = None
+        location = Location(loc_name=name, loc_lat=self.number(record, 'lat'), loc_lng=self.number(record, 'lng'))
+        location.update_geohash()
+        return location
+
+    def create_location(self, locations):
+        Location.objects.bulk_create(locations)
+        self.index_ids(Location, 'loc_name', locations, self.locations)
+
+    def build_hood(self, record):
+        name = self.required(record, 'name')
+        location_id = self.resolve(self.locations, record, 'location')
+        if (name, location_id) in self.hood_keys:
+            return None
+        self.hood_keys.add((name, location_id))
+        return Hood(hood_name=name, hood_location_id=location_id,
+                    hood_admin_id=self.resolve(self.profiles, record, 'admin'))
+
+    def create_hood(self, hoods):
+        Hood.objects.bulk_create(hoods)
+        if any(hood.id is None for hood in hoods):
+            # only postgresql returns the ids of bulk created rows
+            keys = {(hood.hood_name, hood.hood_location_id) for hood in hoods}
+            created = Hood.objects.filter(hood_name__in={name for name, _ in keys}).values_list(
+                'id', 'hood_name', 'hood_location_id')
+            ids = {(name, location_id): hood_id for hood_id, name, location_id in created}
+            for hood in hoods:
+                hood.id = ids[(hood.hood_name, hood.hood_location_id)]
+        for hood in hoods:
+            self.index_hood(hood.id, hood.hood_name, hood.hood_location_id)
+        self.touched_hoods.update(hood.id for hood in hoods)
+
+    def build_business(self, record):
+        category = self.required(record, 'category')
+        if category not in dict(Business.BUSINESS_CHOICES):
+            raise RecordError('unknown business category {!r}'.format(category))
+        business = Business(business_name=self.required(record, 'name'), business_category=category,
+                            business_hood_id=self.resolve(self.hoods, record, 'hood'),
+                            business_owner_id=self.resolve(self.profiles, record, 'owner'),
+                            business_email=self.required(record, 'email'),
+                            business_description=record.get('description'))
+        business.full_clean(exclude=['business_hood', 'business_owner', 'business_search'])
+        return business
+
+    def create_business(self, businesses):
+        Business.objects.bulk_create(businesses)
+        self.touched_hoods.update(business.business_hood_id for business in businesses)
+
+    def finish(self):
+        """
+        method that expires what the skipped signals would have
+        """
+        if self.created['location'] or self.created['hood']:
+            bump_version('hood-directory', 'all')
+        for hood_id in self.touched_hoods:
+            bump_version('hood-businesses', hood_id)
+        HoodStats.reconcile(self.touched_hoods)
+
+    @staticmethod
+    def index_ids(model, name_field, instances, index):
+        if any(instance.id is None for instance in instances):
+            names = [getattr(instance, name_field) for instance in instances]
+            index.update(model.objects.filter(**{name_field + '__in': names}).values_list(name_field, 'id'))
+        else:
+            index.update((getattr(instance, name_field), instance.id) for instance in instances)
+
+    @staticmethod
+    def required(record, field):
+        value = record.get(field)
+        if value is None:
+            raise RecordError('missing {}'.format(field))
+        return str(value).strip()
+
+    @staticmethod
+    def number(record, field):
+        value = record.get(field)
+        return None if value is None else float(value)
+
+    def resolve(self, index, record, field):
+        name = self.required(record, field)
+        object_id = index.get(name)
+        if object_id is None:
+            reason = 'is ambiguous' if name in index else 'does not exist'
+            raise RecordError('{} {!r} {}'.format(field, name, reason))
+        return object_id
+
+
+def export_records(record_type):
+    """
+    function that streams the records of a type as dicts with the import's columns
+    """
+    if record_type == 'location':
+        rows = Location.objects.order_by('id').values_list('loc_name', 'loc_lat', 'loc_lng')
+    elif record_type == 'hood':
+        rows = Hood.objects.order_by('id').values_list(
+            'hood_name', 'hood_location__loc_name', 'hood_admin__profile_owner__username')
+    else:
+        rows = Business.objects.order_by('id').values_list(
+            'business_name', 'business_category', 'business_hood__hood_name',
+            'business_owner__profile_owner__username', 'business_email', 'business_description')
+    for row in rows.iterator():
+        yield dict(zip(FIELDS[record_type], row), type=record_type)
@@ -0,0 +1,134 @@
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision=9):
+    """
+    function that encodes coordinates as a geohash, nearby points share a prefix
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = bit_count = 0
+    return ''.join(geohash)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    function that returns the great circle distance between two points
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    In-process spatial index that buckets points into square cells of cell_size degrees
+    nearest() searches rings of cells outwards from the query and stops as soon as no unsearched
+    cell can hold a point closer than the k-th one found.
+    """
+    def __init__(self, cell_size=0.05):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.size = 0
+        self.bounds = None
+
+    def __len__(self):
+        return self.size
+
+    def cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size))
+
+    def add(self, item, lat, lng):
+        row, column = self.cell(lat, lng)
+        self.cells.setdefault((row, column), []).append((lat, lng, item))
+        self.size += 1
+        if self.bounds is None:
+            self.bounds = [row, row, column, column]
+        else:
+            self.bounds = [min(self.bounds[0], row), max(self.bounds[1], row),
+                           min(self.bounds[2], column), max(self.bounds[3], column)]
+
+    def ring(self, row, column, radius):
+        if radius == 0:
+            yield row, column
+            return
+        for column_offset in range(-radius, radius + 1):
+            yield row - radius, column + column_offset
+            yield row + radius, column + column_offset
+        for row_offset in range(-radius + 1, radius):
+            yield row + row_offset, column - radius
+            yield row + row_offset, column + radius
+
+    def nearest(self, lat, lng, k=5, max_km=None):
+        """
+        method that returns up to k (distance in km, item) pairs closest to a point, nearest first
+        """
+        if not self.size:
+            return []
+        row, column = self.cell(lat, lng)
+        # every searched ring lies inside this radius around the query's cell
+        max_radius = max(abs(row - self.bounds[0]), abs(row - self.bounds[1]),
+                         abs(column - self.bounds[2]), abs(column - self.bounds[3]))
+        found = []
+        for radius in range(max_radius + 1):
+            for cell in self.ring(row, column, radius):
+                for point_lat, point_lng, item in self.cells.get(cell, ()):
+                    found.append((distance_km(lat, lng, point_lat, point_lng), item))
+
+            # points outside the searched rings are at least radius cells away in lat or lng
+            reach = radius * self.cell_size
+            cos_lat = math.cos(math.radians(min(89.0, abs(lat) + reach + self.cell_size)))
+            unsearched_km = reach * KM_PER_DEGREE * cos_lat
+            found.sort(key=lambda pair: pair[0])
+            if max_km is not None and unsearched_km > max_km:
+                break
+            if len(found) >= k and found[k - 1][0] <= unsearched_km:
+                break
+
+        if max_km is not None:
+            found = [pair for pair in found if pair[0] <= max_km]
+        return found[:k]
+
+
+class VersionedIndex:
+    """
+    Process wide GridIndex rebuilt by build() whenever version() changes
+    """
+    def __init__(self, build, version):
+        self.build = build
+        self.version = version
+        self.index = None
+        self.index_version = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = self.version()
+        if self.index is None or self.index_version != version:
+            with self.lock:
+                if self.index is None or self.index_version != version:
+                    self.index = self.build()
+                    self.index_version = version
+        return self.index
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import socket
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+from django.conf import settings
+from django.core import signing
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+STREAM_SALT = 'hood.hub.stream'
+PUBLISH_SALT = 'hood.hub.publish'
+NOTIFY_CHANNEL = 'hood_news'
+# the largest payload a udp datagram can carry
+MAX_DATAGRAM = 65507
+# the largest payload postgresql's NOTIFY accepts
+MAX_NOTIFICATION = 7999
+
+
+def stream_token(hood_id):
+    """
+    function that signs the hood a member may follow on the hub
+    """
+    return signing.dumps(hood_id, salt=STREAM_SALT)
+
+
+def stream_url(hood_id):
+    return '{}?token={}'.format(settings.NEWS_HUB_URL, stream_token(hood_id))
+
+
+def publish(hood_id, event):
+    """
+    function that hands an event to the hub without waiting for it
+    On postgresql the event goes out with NOTIFY, which reaches the hub from any host sharing the
+    database. Other databases fall back to a signed udp datagram, so the hub has to run on the same
+    host as the web workers. A hub that isn't running just misses the event, members still see it
+    on their next reload
+    """
+    if connection.vendor == 'postgresql':
+        notify(hood_id, event)
+    else:
+        send_datagram(hood_id, event)
+
+
+def notify(hood_id, event):
+    payload = json.dumps({'hood': hood_id, 'event': event})
+    if len(payload.encode()) > MAX_NOTIFICATION:
+        # clients fetch oversized posts from the news feed
+        payload = json.dumps({'hood': hood_id, 'event': {'id': event['id']}})
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, payload])
+    except DatabaseError:
+        logger.warning('Could not notify the news hub of news %s', event['id'], exc_info=True)
+
+
+def send_datagram(hood_id, event):
+    datagram = signing.dumps({'hood': hood_id, 'event': event}, salt=PUBLISH_SALT, compress=True).encode()
+    if len(datagram) > MAX_DATAGRAM:
+        # clients fetch oversized posts from the news feed
+        datagram = signing.dumps({'hood': hood_id, 'event': {'id': event['id']}}, salt=PUBLISH_SALT).encode()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.sendto(datagram, (settings.NEWS_HUB_PUBLISH_HOST, settings.NEWS_HUB_PUBLISH_PORT))
+        except OSError:
+            pass
+
+
+def format_event(event):
+    return 'id: {}\nevent: news\ndata: {}\n\n'.format(event['id'], json.dumps(event)).encode()
+
+
+class Subscriber:
+    """
+    Subscriber that buffers the events of one connection
+    A client that falls NEWS_HUB_QUEUE_SIZE events behind is disconnected and replays the
+    backlog when it reconnects, so one slow reader never holds up the rest of the hood
+    """
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=settings.NEWS_HUB_QUEUE_SIZE)
+
+    def send(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class PublishProtocol(asyncio.DatagramProtocol):
+    def __init__(self, hub):
+        self.hub = hub
+
+    def datagram_received(self, data, addr):
+        try:
+            message = signing.loads(data.decode(), salt=PUBLISH_SALT, max_age=settings.NEWS_HUB_PUBLISH_MAX_AGE)
+        except (signing.BadSignature, UnicodeDecodeError):
+            return
+        self.hub.publish(message['hood'], message['event'])
+
+
+class NewsHub:
+    """
+    Server-sent events hub that fans new posts out to every connected member of a hood
+    Connections are plain asyncio streams, so thousands of idle members cost a queue each
+    instead of a worker. Posts arrive from publish() as postgresql notifications on a connection
+    passed to listen(), or as signed udp datagrams when started with a publish address.
+    """
+    def __init__(self):
+        self.subscribers = {}
+        self.backlogs = {}
+        self.server = None
+        self.transport = None
+        self.listener = None
+        self.listener_fd = None
+
+    async def start(self, host, port, publish_host=None, publish_port=None):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        if publish_host is not None:
+            self.transport, _ = await asyncio.get_event_loop().create_datagram_endpoint(
+                lambda: PublishProtocol(self), local_addr=(publish_host, publish_port))
+
+    def listen(self, listener):
+        """
+        method that takes the events publish() notifies on an autocommit psycopg2 connection
+        """
+        self.listener = listener
+        with listener.cursor() as cursor:
+            cursor.execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+        self.listener_fd = listener.fileno()
+        asyncio.get_event_loop().add_reader(self.listener_fd, self.read_notifications)
+
+    def read_notifications(self):
+        try:
+            self.listener.poll()
+        except Exception:
+            # stop, so the process manager restarts the hub with a new connection
+            logger.exception('Lost the news hub database connection')
+            asyncio.get_event_loop().stop()
+            return
+        while self.listener.notifies:
+            message = json.loads(self.listener.notifies.pop(0).payload)
+            self.publish(message['hood'], message['event'])
+
+    def close(self):
+        self.server.close()
+        if self.transport is not None:
+            self.transport.close()
+        if self.listener is not None:
+            asyncio.get_event_loop().remove_reader(self.listener_fd)
+            self.listener.close()
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.send(None)
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()[:2]
+
+    @property
+    def publish_address(self):
+        return self.transport.get_extra_info('sockname')[:2]
+
+    def publish(self, hood_id, event):
+        """
+        method that queues an event for every member of a hood following the hub
+        """
+        self.backlogs.setdefault(hood_id, deque(maxlen=settings.NEWS_HUB_BACKLOG)).append(event)
+        for subscriber in self.subscribers.get(hood_id, ()):
+            subscriber.send(event)
+
+    def missed(self, hood_id, last_event_id):
+        """
+        method that returns the backlog events a reconnecting client hasn't seen
+        """
+        try:
+            last_event_id = int(last_event_id)
+        except (TypeError, ValueError):
+            return []
+        return [event for event in self.backlogs.get(hood_id, ()) if event['id'] > last_event_id]
+
+    async def read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), settings.NEWS_HUB_KEEPALIVE)
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        return method, parse_qs(urlsplit(target).query), headers
+
+    async def handle(self, reader, writer):
+        try:
+            method, query, headers = await self.read_request(reader)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            writer.close()
+            return
+
+        try:
+            hood_id = signing.loads(query.get('token', [''])[0], salt=STREAM_SALT,
+                                    max_age=settings.NEWS_HUB_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            hood_id = None
+        if method != 'GET' or hood_id is None:
+            writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+
+        subscriber = Subscriber()
+        self.subscribers.setdefault(hood_id, set()).add(subscriber)
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n')
+        try:
+            for event in self.missed(hood_id, headers.get('last-event-id')):
+                writer.write(format_event(event))
+            while True:
+                await writer.drain()
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), settings.NEWS_HUB_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # comments keep proxies from closing idle streams and find dead clients
+                    writer.write(b': keepalive\n\n')
+                    continue
+                if event is None:
+                    break
+                writer.write(format_event(event))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.subscribers[hood_id].discard(subscriber)
+            if not self.subscribers[hood_id]:
+                del self.subscribers[hood_id]
+            writer.close()
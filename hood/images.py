@@ -0,0 +1,146 @@
+import os
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# formats an upload is re-encoded in, anything else is converted to jpeg
+KEPT_FORMATS = ('JPEG', 'PNG', 'WEBP')
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def rendition_name(name, width, extension):
+    """
+    function that returns the storage name of an image's rendition, e.g. footages/cat_640.webp
+    """
+    base, _ = os.path.splitext(name)
+    return '{}_{}.{}'.format(base, width, extension)
+
+
+def rendition_urls(image):
+    """
+    function that returns the urls of an image's renditions as {width: {'jpg': url, 'webp': url}}
+    Images still waiting for the worker have no renditions yet
+    """
+    if not image or not getattr(image.instance, image.field.name + '_ready', True):
+        return {}
+    return {width: {extension: image.storage.url(rendition_name(image.name, width, extension))
+                    for extension in ('jpg', 'webp')}
+            for width in settings.IMAGE_RENDITION_WIDTHS}
+
+
+def encode(image, image_format):
+    """
+    function that encodes an image without any of the source's metadata
+    """
+    output = BytesIO()
+    if image_format in ('JPEG', 'WEBP'):
+        image.save(output, image_format, quality=settings.IMAGE_QUALITY, optimize=image_format == 'JPEG')
+    else:
+        image.save(output, image_format, optimize=True)
+    return output.getvalue()
+
+
+def flatten(image):
+    """
+    function that converts an image to RGB, painting transparent areas white
+    """
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def process_image(storage, name):
+    """
+    function that writes a size capped copy of an uploaded image, stripped of exif data, and its
+    jpeg and webp renditions next to the upload
+    The upload itself is left alone until the job has pointed its instance at the copy, and
+    anything written before a failure is removed so the retry starts from the upload again.
+    Returns:
+        the copy's storage name
+    """
+    with storage.open(name) as source:
+        image = Image.open(source)
+        image_format = image.format
+        image.load()
+
+    # apply the exif orientation before the exif data is dropped
+    image = ImageOps.exif_transpose(image)
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    if image_format not in KEPT_FORMATS:
+        image_format = 'JPEG'
+    if image_format == 'JPEG':
+        image = flatten(image)
+
+    written = []
+    try:
+        # the upload still holds its name, so the storage picks a free one for the copy
+        new_name = '{}.{}'.format(os.path.splitext(name)[0], EXTENSIONS[image_format])
+        new_name = storage.save(new_name, ContentFile(encode(image, image_format)))
+        written.append(new_name)
+
+        flat_image = flatten(image)
+        for width in settings.IMAGE_RENDITION_WIDTHS:
+            rendition = flat_image.copy()
+            rendition.thumbnail((width, width * 4), Image.LANCZOS)
+            for rendition_format, extension in (('JPEG', 'jpg'), ('WEBP', 'webp')):
+                rendition_path = rendition_name(new_name, width, extension)
+                storage.delete(rendition_path)
+                written.append(storage.save(rendition_path, ContentFile(encode(rendition, rendition_format))))
+    except Exception:
+        for written_name in written:
+            storage.delete(written_name)
+        raise
+    return new_name
+
+
+def delete_image(storage, name, renditions=False):
+    """
+    function that deletes an image from storage, with its renditions when asked
+    """
+    storage.delete(name)
+    if renditions:
+        for width in settings.IMAGE_RENDITION_WIDTHS:
+            for extension in ('jpg', 'webp'):
+                storage.delete(rendition_name(name, width, extension))
+
+
+def process_upload(name):
+    """
+    function that processes an image in the default storage, run in the worker's process pool
+    """
+    return process_image(default_storage, name)
+
+
+def run_image_jobs(executor, batch_size):
+    """
+    function that claims a batch of image jobs and processes them on an executor
+    Returns:
+        a (processed, failed) tuple of counts
+    """
+    from .models import ImageJob
+
+    jobs = ImageJob.claim(batch_size)
+    futures = [(job, executor.submit(process_upload, job.job_image)) for job in jobs]
+    processed = failed = 0
+    for job, future in futures:
+        try:
+            processed_name = future.result()
+        except Exception as error:
+            job.mark_failed(error)
+            failed += 1
+        else:
+            if job.mark_done(processed_name):
+                if processed_name != job.job_image:
+                    delete_image(default_storage, job.job_image)
+            else:
+                # the image was replaced while the job ran, its newer job processes that one
+                delete_image(default_storage, processed_name, renditions=True)
+            processed += 1
+    return processed, failed
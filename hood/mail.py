@@ -0,0 +1,41 @@
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from .models import OutgoingEmail
+
+
+def deliver_queued_emails(batch_size=50):
+    """
+    function that sends one batch of due emails over a single smtp connection
+    Rows are locked while they are sent so several workers can drain the outbox at once.
+    Returns:
+        a (sent, failed) tuple of counts
+    """
+    sent = failed = 0
+    with transaction.atomic():
+        emails = list(OutgoingEmail.due().select_for_update(skip_locked=True)[:batch_size])
+        if not emails:
+            return sent, failed
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as error:
+            for email in emails:
+                email.mark_failed(error)
+            return sent, len(emails)
+
+        try:
+            for email in emails:
+                message = EmailMessage(email.email_subject, email.email_body, email.email_from or None,
+                                       [email.email_to], connection=connection)
+                try:
+                    message.send()
+                except Exception as error:
+                    email.mark_failed(error)
+                    failed += 1
+                else:
+                    email.mark_sent()
+                    sent += 1
+        finally:
+            connection.close()
+    return sent, failed
@@ -0,0 +1,35 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from hood.directory import FIELDS, TYPE_ORDER, export_records
+
+
+class Command(BaseCommand):
+    help = 'Streams locations, hoods and businesses out in the format import_directory reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default='jsonl')
+        parser.add_argument('--type', choices=TYPE_ORDER, action='append',
+                            help='Record type to export, repeat for several. Defaults to all of them')
+        parser.add_argument('--output', help='File to write to instead of standard output')
+
+    def handle(self, *args, **options):
+        record_types = options['type'] or TYPE_ORDER
+        if options['format'] == 'csv' and len(record_types) != 1:
+            raise CommandError('csv exports hold a single record type, pick one with --type')
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else self.stdout
+        try:
+            if options['format'] == 'csv':
+                writer = csv.DictWriter(output, fieldnames=FIELDS[record_types[0]], extrasaction='ignore')
+                writer.writeheader()
+                for record in export_records(record_types[0]):
+                    writer.writerow(record)
+            else:
+                for record_type in TYPE_ORDER:
+                    if record_type in record_types:
+                        for record in export_records(record_type):
+                            output.write(json.dumps(record) + '\n')
+        finally:
+            if options['output']:
+                output.close()
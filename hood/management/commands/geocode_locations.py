@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from hood.models import Location
+from hood.cache import shared_cache_warning
+
+
+class Command(BaseCommand):
+    help = ('Geocodes locations without coordinates, retrying names the geocode api could not resolve '
+            'once GEOCODE_RETRY_AFTER has passed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of locations geocoded at a time')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for due locations instead of exiting once none are left')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds to sleep between polls when no location is due')
+
+    def handle(self, *args, **options):
+        warning = shared_cache_warning()
+        if warning:
+            self.stderr.write(warning)
+        total_attempted = total_resolved = 0
+        while True:
+            attempted, resolved = Location.geocode_pending(limit=options['batch_size'])
+            total_attempted += attempted
+            total_resolved += resolved
+            if attempted == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write('Geocoded {} of {} locations'.format(total_resolved, total_attempted))
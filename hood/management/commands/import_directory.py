@@ -0,0 +1,42 @@
+import io
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from hood.directory import DirectoryImporter, read_records, TYPE_ORDER
+from hood.cache import shared_cache_warning
+
+
+class Command(BaseCommand):
+    help = 'Bulk imports locations, hoods and businesses from a csv or jsonl file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, - reads standard input")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Input format, guessed from the file extension by default')
+        parser.add_argument('--type', choices=TYPE_ORDER,
+                            help='Record type of rows without a type column')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of records written per transaction')
+
+    def handle(self, *args, **options):
+        warning = shared_cache_warning()
+        if warning:
+            self.stderr.write(warning)
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+
+        with stream:
+            importer = DirectoryImporter(chunk_size=options['chunk_size'])
+            created, errors = importer.run(read_records(stream, file_format, options['type']))
+
+        for line, error in errors:
+            self.stderr.write('Line {}: {}'.format(line, error))
+        self.stdout.write('Created {location} locations, {hood} hoods and {business} businesses'.format(**created))
+        if errors:
+            self.stdout.write('Skipped {} invalid records'.format(len(errors)))
@@ -0,0 +1,40 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from hood.images import run_image_jobs
+from hood.cache import shared_cache_warning
+
+
+class Command(BaseCommand):
+    help = 'Processes queued news footage and profile photo uploads on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Number of processes decoding and resizing images')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Number of jobs claimed at a time')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for jobs instead of exiting once the queue is drained')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds to sleep between polls when the queue is empty')
+
+    def handle(self, *args, **options):
+        warning = shared_cache_warning()
+        if warning:
+            self.stderr.write(warning)
+        total_processed = total_failed = 0
+        # the pool forks this process, don't let children share its database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                processed, failed = run_image_jobs(executor, options['batch_size'])
+                total_processed += processed
+                total_failed += failed
+                if processed or failed:
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write('Processed {} images, {} failed'.format(total_processed, total_failed))
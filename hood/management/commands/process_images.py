@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from hood.models import Profile, News, ImageJob
+
+
+class Command(BaseCommand):
+    help = 'Queues news footage and profile photos that have no renditions yet for process_image_jobs'
+
+    def handle(self, *args, **options):
+        queued = 0
+        for model, field_name in ((News, 'news_footage'), (Profile, 'profile_photo')):
+            instances = model.objects.exclude(**{field_name: ''}).exclude(**{field_name: None}).filter(
+                **{field_name + '_ready': False}).only('id', field_name)
+            for instance in instances.iterator():
+                ImageJob.queue(instance, field_name)
+                queued += 1
+
+        self.stdout.write('Queued {} images'.format(queued))
@@ -0,0 +1,37 @@
+import io
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from hood.directory import read_records
+from hood.provisioning import MemberProvisioner
+
+
+class Command(BaseCommand):
+    help = 'Bulk creates the members of existing hoods from a csv or jsonl file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, - reads standard input")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Input format, guessed from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of members written per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+
+        with stream:
+            provisioner = MemberProvisioner(chunk_size=options['chunk_size'])
+            created, errors = provisioner.run(read_records(stream, file_format, 'member'))
+
+        for line, error in errors:
+            self.stderr.write('Line {}: {}'.format(line, error))
+        self.stdout.write('Created {} members'.format(created))
+        if errors:
+            self.stdout.write('Skipped {} invalid records'.format(len(errors)))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from hood.models import HoodStats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the member, post and business counts of hoods from their rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('hood_ids', nargs='*', type=int, help='Hoods to reconcile, every hood by default')
+
+    def handle(self, *args, **options):
+        reconciled = HoodStats.reconcile(options['hood_ids'] or None)
+        self.stdout.write('Reconciled {} hoods'.format(reconciled))
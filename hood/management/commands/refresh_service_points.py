@@ -0,0 +1,60 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from hood.services import KINDS, csv_records, places_records, refresh_service_points, uncovered_centres
+from hood.cache import shared_cache_warning
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the local directory of police stations and hospitals from the places api or a csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', dest='path',
+                            help='Load service points from a csv with name, kind, lat, lng, vicinity and place_id '
+                                 'columns instead of the places api')
+        parser.add_argument('--kind', choices=KINDS, action='append',
+                            help='Only refresh this kind from the places api, may be repeated')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, refreshing every hood each SERVICE_POINTS_REFRESH_SECONDS and '
+                                 'looking up hoods with no service points in reach in between')
+        parser.add_argument('--interval', type=float, default=300,
+                            help='Seconds to sleep between looking for hoods with no service points in reach')
+
+    def handle(self, *args, **options):
+        warning = shared_cache_warning()
+        if warning:
+            self.stderr.write(warning)
+        if options['path']:
+            try:
+                stream = open(options['path'], encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+            with stream:
+                self.report(*refresh_service_points(csv_records(stream)))
+            return
+
+        kinds = options['kind'] or KINDS
+        refreshed_at = None
+        while True:
+            try:
+                if refreshed_at is None or time.monotonic() - refreshed_at >= settings.SERVICE_POINTS_REFRESH_SECONDS:
+                    # every hood was looked up, so points places no longer returns are removed
+                    self.report(*refresh_service_points(places_records(kinds), prune_kinds=kinds))
+                    refreshed_at = time.monotonic()
+                else:
+                    centres = uncovered_centres(kinds)
+                    if centres:
+                        self.report(*refresh_service_points(places_records(kinds, centres)))
+            except Exception as error:
+                if not options['loop']:
+                    raise
+                # nothing was pruned, the refresh is tried again next round
+                self.stderr.write('Could not refresh service points: {}'.format(error))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, created, updated, deleted, errors):
+        for number, error in errors:
+            self.stderr.write('Record {}: {}'.format(number, error))
+        self.stdout.write('Created {}, updated {} and deleted {} service points'.format(created, updated, deleted))
@@ -0,0 +1,50 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from hood.bench import FLOWS, Benchmark, StubMapsServer, seed, stub_maps, volumes
+
+
+class Command(BaseCommand):
+    help = ('Seeds bench-* hoods, then drives the main flows concurrently against a stub maps server '
+            'and reports throughput, latency percentiles and queries per request as json. '
+            'Run it against a dedicated database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hoods', type=int, default=10, help='Number of hoods to seed')
+        parser.add_argument('--members', type=int, default=20, help='Members seeded per hood')
+        parser.add_argument('--news', type=int, default=50, help='News posts seeded per hood')
+        parser.add_argument('--businesses', type=int, default=20, help='Businesses seeded per hood')
+        parser.add_argument('--service-points', type=int, default=20,
+                            help='Police stations and hospitals seeded around the hoods')
+        parser.add_argument('--flow', choices=list(FLOWS), action='append', dest='flows',
+                            help='Flow to drive, may be repeated, every flow by default')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of members active at once')
+        parser.add_argument('--iterations', type=int, default=20, help='Times each member runs the flows')
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Seconds the stub maps server waits before answering')
+        parser.add_argument('--live-places', action='store_true',
+                            help='Look police stations and hospitals up on the stub places api on every index')
+        parser.add_argument('--output', help='File to write the json report to, standard output by default')
+
+    def handle(self, *args, **options):
+        if min(options['hoods'], options['members'], options['concurrency'], options['iterations']) < 1:
+            raise CommandError('hoods, members, concurrency and iterations must be at least 1')
+
+        with StubMapsServer(latency=options['latency']) as server, stub_maps(server):
+            members = seed(options['hoods'], options['members'], options['news'], options['businesses'],
+                           0 if options['live_places'] else options['service_points'])
+            # what the run actually sees, in case the seeded volumes ever disagree with the options
+            dataset = volumes()
+            with override_settings(SERVICE_POINTS_LIVE_FALLBACK=options['live_places']):
+                benchmark = Benchmark(members, options['flows'] or tuple(FLOWS), options['concurrency'],
+                                      options['iterations'])
+                report = benchmark.run()
+
+        dataset.update(latency=options['latency'], live_places=options['live_places'])
+        report['dataset'] = dataset
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,37 @@
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from hood.hub import NewsHub
+
+
+class Command(BaseCommand):
+    help = ('Runs the server-sent events hub that streams new posts to hood members. On postgresql it '
+            'listens for posts on the database, so it can run on its own host; members must be able to '
+            'reach it at NEWS_HUB_URL. On Heroku, run it as the web process of a second app sharing '
+            'DATABASE_URL and SECRET_KEY: "web: python manage.py run_news_hub --port $PORT". Other '
+            'databases take posts over udp from web workers on the same host.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0', help='Address members connect to')
+        parser.add_argument('--port', type=int, default=8001, help='Port members connect to')
+
+    def handle(self, *args, **options):
+        loop = asyncio.get_event_loop()
+        hub = NewsHub()
+        if connection.vendor == 'postgresql':
+            import psycopg2
+            loop.run_until_complete(hub.start(options['host'], options['port']))
+            listener = psycopg2.connect(**connection.get_connection_params())
+            listener.autocommit = True
+            hub.listen(listener)
+        else:
+            loop.run_until_complete(hub.start(options['host'], options['port'],
+                                              settings.NEWS_HUB_PUBLISH_HOST, settings.NEWS_HUB_PUBLISH_PORT))
+        self.stdout.write('Streaming news on {}:{}'.format(*hub.address))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            hub.close()
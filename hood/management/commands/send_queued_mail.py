@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from hood.mail import deliver_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Sends the emails queued in the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Number of emails sent over one smtp connection')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting once it is drained')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep between polls when the outbox is empty')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_queued_emails(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write('Sent {} emails, {} failed'.format(total_sent, total_failed))
@@ -0,0 +1,132 @@
+import hashlib
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from googlemaps import Client
+from django.conf import settings
+from .cache import TTLCache
+from .metrics import EXTERNAL_SECONDS, timed
+
+_nearby_cache = None
+_gmaps = None
+_executor = None
+
+
+def geocode(place):
+    """
+    function that looks up a place name on the geocode api
+    Returns:
+        a {'lat': ..., 'lng': ...} dict or None when the place can't be resolved
+    """
+    place = place.strip().replace(" ", "+")
+    try:
+        with timed(EXTERNAL_SECONDS, 'external', service='geocode'):
+            response = requests.get(settings.GEOCODE_URL.format(place, settings.GOOGLE_API),
+                                    timeout=settings.GEOCODE_TIMEOUT)
+        results = response.json()['results']
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+    if not results:
+        return None
+    return results[0]['geometry']['location']
+
+
+def get_gmaps():
+    """
+    function that returns the process wide googlemaps client
+    """
+    global _gmaps
+    if _gmaps is None:
+        _gmaps = Client(key=settings.GOOGLE_API, timeout=settings.NEARBY_LOOKUP_TIMEOUT,
+                        retry_timeout=settings.NEARBY_LOOKUP_TIMEOUT)
+    return _gmaps
+
+
+def get_nearby_cache():
+    """
+    function that returns the process wide cache of places_nearby results
+    """
+    global _nearby_cache
+    if _nearby_cache is None:
+        _nearby_cache = TTLCache(maxsize=settings.NEARBY_CACHE_SIZE,
+                                 ttl=settings.NEARBY_CACHE_TTL,
+                                 stale_ttl=settings.NEARBY_CACHE_STALE_TTL,
+                                 failure_ttl=settings.NEARBY_FAILURE_TTL)
+    return _nearby_cache
+
+
+def get_executor():
+    """
+    function that returns the bounded thread pool external lookups run on
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.NEARBY_LOOKUP_WORKERS)
+    return _executor
+
+
+def nearby_cache_key(coordinates, place_type):
+    return (round(coordinates['lat'], 5), round(coordinates['lng'], 5), place_type)
+
+
+def nearby_places(coordinates, place_type):
+    """
+    function that returns the places of a type closest to some coordinates
+    Results are shared by every hood at the same coordinates until they expire, and concurrent
+    requests for the same coordinates wait on a single lookup. A failed lookup is raised again
+    for NEARBY_FAILURE_TTL seconds instead of calling the places api on every request.
+    """
+    key = nearby_cache_key(coordinates, place_type)
+    return get_nearby_cache().get_or_load(key, lambda: places_nearby(coordinates, place_type))
+
+
+def nearby_services_stamp(coordinates, place_types=('police', 'hospital')):
+    """
+    function that returns a digest of the cached results around some coordinates, which changes
+    whenever a lookup fills, refreshes or drops one of them
+    """
+    cache = get_nearby_cache()
+    cached = [cache.get(nearby_cache_key(coordinates, place_type)) for place_type in place_types]
+    return hashlib.md5(repr(cached).encode()).hexdigest()
+
+
+def nearby_services(coordinates, place_types=('police', 'hospital')):
+    """
+    function that looks up several place types around some coordinates at once
+    Cached types, and types whose lookup recently failed, are answered inline and the rest run
+    concurrently on the thread pool. A lookup that fails or doesn't finish within
+    NEARBY_LOOKUP_TIMEOUT comes back with empty results and still fills the cache for the next
+    request once it completes.
+    Returns:
+        a {place_type: places_nearby results} dict
+    """
+    services = {}
+    pending = {}
+    cache = get_nearby_cache()
+    for place_type in place_types:
+        if nearby_cache_key(coordinates, place_type) in cache:
+            try:
+                services[place_type] = nearby_places(coordinates, place_type)
+            except Exception:
+                services[place_type] = {'results': []}
+        else:
+            pending[place_type] = get_executor().submit(nearby_places, coordinates, place_type)
+
+    deadline = time.monotonic() + settings.NEARBY_LOOKUP_TIMEOUT
+    for place_type, future in pending.items():
+        try:
+            services[place_type] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception:
+            services[place_type] = {'results': []}
+    return services
+
+
+def places_nearby(coordinates, place_type, open_now=True):
+    """
+    function that queries the places api for the places of a type closest to some coordinates
+    """
+    with timed(EXTERNAL_SECONDS, 'external', service='places'):
+        return get_gmaps().places_nearby(location=coordinates, keyword=place_type,
+                                         language='en-US', open_now=open_now,
+                                         rank_by='distance', type=place_type)
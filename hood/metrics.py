@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection, connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+_flush_in_background = False
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """
+    Thread safe histogram of observations per label set, rendered in the prometheus text format
+    Observations collect in the process until flush_metrics() adds them to the MetricSample rows
+    every worker shares, so a scrape sees the totals of all of them
+    """
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            counts, total, count = self.pending.get(key, ((0,) * len(self.buckets), 0, 0))
+            counts = tuple(bucket + (value <= bound) for bucket, bound in zip(counts, self.buckets))
+            self.pending[key] = (counts, total + value, count + 1)
+
+    def take(self):
+        """
+        method that returns the observations made since the last take as {labels: (counts, sum, count)}
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+
+    def rows(self, samples):
+        """
+        method that turns {labels: (counts, sum, count)} into (labels, field, value) MetricSample rows
+        """
+        for key, (counts, total, count) in samples.items():
+            labels = json.dumps(key)
+            for bound, bucket in zip(self.buckets, counts):
+                if bucket:
+                    yield labels, 'le={}'.format(bound), bucket
+            yield labels, 'sum', total
+            yield labels, 'count', count
+
+    def render(self, rows):
+        """
+        method that renders this histogram's (labels, field, value) rows
+        """
+        series = {}
+        for labels, field, value in rows:
+            series.setdefault(tuple(json.loads(labels)), {})[field] = value
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for key, fields in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            counts = tuple(int(fields.get('le={}'.format(bound), 0)) for bound in self.buckets)
+            count = int(fields.get('count', 0))
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts + (count,)):
+                lines.append('{}_bucket{} {}'.format(self.name, format_labels(labels + [('le', bound)]), bucket))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(labels), fields.get('sum', 0)))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    escaped = ('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in labels)
+    return '{' + ','.join(escaped) + '}' if labels else ''
+
+
+REQUEST_SECONDS = Histogram('hood_request_duration_seconds', 'Time spent answering requests by url name.',
+                            ('view', 'method', 'status'))
+REQUEST_QUERIES = Histogram('hood_request_queries', 'SQL queries run per request by url name.',
+                            ('view',), COUNT_BUCKETS)
+QUERY_SECONDS = Histogram('hood_request_query_seconds', 'Time spent in SQL queries per request by url name.',
+                          ('view',))
+EXTERNAL_SECONDS = Histogram('hood_external_call_seconds', 'Time spent calling external apis by service.',
+                             ('service',))
+TEMPLATE_SECONDS = Histogram('hood_template_render_seconds', 'Time spent rendering templates by template name.',
+                             ('template',))
+METRICS = (REQUEST_SECONDS, REQUEST_QUERIES, QUERY_SECONDS, EXTERNAL_SECONDS, TEMPLATE_SECONDS)
+
+
+def flush_metrics():
+    """
+    function that adds this process's observations since the last flush to the shared MetricSample rows
+    """
+    from .models import MetricSample
+
+    for metric in METRICS:
+        for labels, field, value in metric.rows(metric.take()):
+            MetricSample.add(metric.name, labels, field, value)
+
+
+def render_metrics():
+    """
+    function that renders the metrics of every worker, flushing this one's first
+    """
+    from .models import MetricSample
+
+    flush_metrics()
+    rows = {}
+    for name, labels, field, value in MetricSample.objects.values_list(
+            'metric_name', 'metric_labels', 'metric_field', 'metric_value'):
+        rows.setdefault(name, []).append((labels, field, value))
+    return ''.join(metric.render(rows.get(metric.name, ())) for metric in METRICS)
+
+
+def flush_in_background():
+    """
+    function that makes every worker process flush its metrics every METRICS_FLUSH_SECONDS
+    Called from the wsgi module, so the test client and the benchmark keep theirs in memory
+    """
+    global _flush_in_background
+    _flush_in_background = True
+
+
+def start_flusher():
+    # runs on each request so workers forked after the wsgi module was loaded start their own
+    global _flusher_pid
+    if not _flush_in_background or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=flush_forever, daemon=True).start()
+
+
+def flush_forever():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_SECONDS)
+        try:
+            flush_metrics()
+        except Exception:
+            # the observations taken for this flush are lost, later ones still get added
+            logger.exception('Could not flush request metrics')
+        finally:
+            connection.close()
+
+
+class RequestStats:
+    """
+    RequestStats that collects where one request spent its time
+    """
+    def __init__(self):
+        self.queries = []
+        self.times = Counter()
+
+    @property
+    def query_seconds(self):
+        return sum(duration for _, duration in self.queries)
+
+    def breakdown(self, limit=5):
+        """
+        method that returns the statements that took longest in total as (sql, count, seconds) tuples
+        """
+        totals = {}
+        for sql, duration in self.queries:
+            count, seconds = totals.get(sql, (0, 0))
+            totals[sql] = (count + 1, seconds + duration)
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [(sql, count, seconds) for sql, (count, seconds) in ranked]
+
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def timed(histogram, part=None, **labels):
+    """
+    context manager that observes how long its block took, adding it to the current request's
+    part, e.g. 'external', when there is one
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        stats = current_stats()
+        if stats is not None and part is not None:
+            stats.times[part] += elapsed
+
+
+@contextmanager
+def collect_queries(stats):
+    """
+    context manager that records the queries run in its block on stats.queries
+    Django 1.11 has no connection.execute_wrapper, so this turns on the debug cursor and reads the
+    block's queries back from connection.queries_log
+    """
+    logged = []
+    for database in connections.all():
+        logged.append((database, database.force_debug_cursor, len(database.queries_log)))
+        database.force_debug_cursor = True
+    try:
+        yield
+    finally:
+        for database, force_debug_cursor, start in logged:
+            database.force_debug_cursor = force_debug_cursor
+            stats.queries.extend((query['sql'], float(query['time']))
+                                 for query in list(database.queries_log)[start:])
+
+
+class MetricsMiddleware(object):
+    """
+    Middleware that records each request's latency, SQL queries, external api time and template
+    render time by url name, and logs the requests slower than SLOW_REQUEST_SECONDS
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_flusher()
+        # kept on the request so the benchmark can report queries per request
+        stats = request.metrics = _local.stats = RequestStats()
+        start = time.perf_counter()
+        try:
+            with collect_queries(stats):
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match is not None and match.url_name else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(len(stats.queries), view=view)
+        QUERY_SECONDS.observe(stats.query_seconds, view=view)
+
+        if elapsed >= settings.SLOW_REQUEST_SECONDS:
+            self.log_slow_request(request, view, elapsed, stats)
+        return response
+
+    def log_slow_request(self, request, view, elapsed, stats):
+        lines = ['Slow request {} {} ({}) took {:.3f}s: {} queries in {:.3f}s, external {:.3f}s, '
+                 'templates {:.3f}s'.format(request.method, request.path, view, elapsed, len(stats.queries),
+                                            stats.query_seconds, stats.times['external'], stats.times['template'])]
+        for sql, count, seconds in stats.breakdown():
+            lines.append('  {:.3f}s {}x {}'.format(seconds, count, sql))
+        logger.warning('\n'.join(lines))
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        # templates rendered while another renders, like a cached feed fragment, count once towards the request
+        depth = getattr(_local, 'template_depth', 0)
+        _local.template_depth = depth + 1
+        try:
+            with timed(TEMPLATE_SECONDS, None if depth else 'template',
+                       template=self.origin.template_name or '<string>'):
+                return super().render(context, request)
+        finally:
+            _local.template_depth = depth
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend whose templates record how long they take to render
+    """
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
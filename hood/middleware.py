@@ -0,0 +1,26 @@
+from django.utils.functional import SimpleLazyObject
+from .models import Profile
+
+
+def get_profile(request):
+    """
+    function that loads the request user's profile, hood and location once per request
+    Users from CachedModelBackend come with theirs
+    """
+    if not hasattr(request, '_cached_profile'):
+        profile = getattr(request.user, '_request_profile', None)
+        request._cached_profile = profile if profile is not None else Profile.find_request_profile(request.user)
+    return request._cached_profile
+
+
+class HoodProfileMiddleware(object):
+    """
+    Middleware that sets request.profile to the logged in user's profile, loaded lazily on first use
+    request.profile is falsy for anonymous users
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request))
+        return self.get_response(request)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0003_news'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='loc_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='loc_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
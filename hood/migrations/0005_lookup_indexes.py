@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# hood_name__iexact compiles to UPPER("hood_name"::text) = UPPER(%s) on postgresql
+CREATE_HOOD_NAME_INDEX = 'CREATE INDEX hood_hood_name_upper_idx ON hood_hood (UPPER(hood_name::text))'
+DROP_HOOD_NAME_INDEX = 'DROP INDEX IF EXISTS hood_hood_name_upper_idx'
+
+
+def create_hood_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_HOOD_NAME_INDEX)
+
+
+def drop_hood_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_HOOD_NAME_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0004_location_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hood',
+            index=models.Index(fields=['hood_location', 'hood_name'], name='hood_hood_hood_lo_d5865c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['business_hood', 'business_category'], name='hood_busine_busines_66cd88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['news_hood', '-news_pub_date', '-id'], name='hood_news_news_ho_0d32c6_idx'),
+        ),
+        migrations.RunPython(create_hood_name_index, drop_hood_name_index),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0005_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email_subject', models.CharField(max_length=255)),
+                ('email_body', models.TextField()),
+                ('email_from', models.CharField(blank=True, max_length=254)),
+                ('email_to', models.EmailField(max_length=254)),
+                ('email_status', models.CharField(choices=[('P', 'Pending'), ('S', 'Sent'), ('D', 'Dead')], default='P', max_length=1)),
+                ('email_attempts', models.PositiveSmallIntegerField(default=0)),
+                ('email_next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('email_last_error', models.TextField(blank=True)),
+                ('email_created', models.DateTimeField(auto_now_add=True)),
+                ('email_sent', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(fields=['email_status', 'email_next_attempt'], name='hood_outgoi_email_s_189ed8_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0006_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='news_footage_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='profile_photo_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_field', models.CharField(choices=[('news_footage', 'News footage'), ('profile_photo', 'Profile photo')], max_length=20)),
+                ('job_object_id', models.PositiveIntegerField()),
+                ('job_image', models.CharField(max_length=255)),
+                ('job_status', models.CharField(choices=[('P', 'Pending'), ('R', 'Running'), ('D', 'Done'), ('F', 'Failed')], default='P', max_length=1)),
+                ('job_attempts', models.PositiveSmallIntegerField(default=0)),
+                ('job_last_error', models.TextField(blank=True)),
+                ('job_created', models.DateTimeField(auto_now_add=True)),
+                ('job_claimed', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(fields=['job_status', 'job_created'], name='hood_imagej_job_sta_515d52_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# the triggers keep the search columns in step with every insert and update, including bulk ones
+SEARCH_SQL = [
+    """
+    CREATE FUNCTION hood_news_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.news_search := to_tsvector('pg_catalog.english', coalesce(NEW.news_details, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER hood_news_search_update BEFORE INSERT OR UPDATE ON hood_news
+    FOR EACH ROW EXECUTE PROCEDURE hood_news_search_trigger()
+    """,
+    """
+    CREATE FUNCTION hood_business_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.business_search :=
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.business_name, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.business_description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER hood_business_search_update BEFORE INSERT OR UPDATE ON hood_business
+    FOR EACH ROW EXECUTE PROCEDURE hood_business_search_trigger()
+    """,
+    # fire the triggers once to fill in existing rows
+    'UPDATE hood_news SET news_search = NULL',
+    'UPDATE hood_business SET business_search = NULL',
+    'CREATE INDEX hood_news_search_idx ON hood_news USING gin (news_search)',
+    'CREATE INDEX hood_business_search_idx ON hood_business USING gin (business_search)',
+]
+
+DROP_SEARCH_SQL = [
+    'DROP TRIGGER IF EXISTS hood_news_search_update ON hood_news',
+    'DROP FUNCTION IF EXISTS hood_news_search_trigger()',
+    'DROP TRIGGER IF EXISTS hood_business_search_update ON hood_business',
+    'DROP FUNCTION IF EXISTS hood_business_search_trigger()',
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in SEARCH_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_SEARCH_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0008_business_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='business_search',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='news_search',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
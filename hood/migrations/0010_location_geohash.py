@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from hood.geo import geohash_encode
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model('hood', 'Location')
+    for location in Location.objects.filter(loc_lat__isnull=False, loc_lng__isnull=False).iterator():
+        location.loc_geohash = geohash_encode(location.loc_lat, location.loc_lng)
+        location.save(update_fields=['loc_geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0009_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='loc_geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0010_location_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServicePoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_name', models.CharField(max_length=255)),
+                ('service_kind', models.CharField(choices=[('police', 'Police'), ('hospital', 'Hospital')], max_length=20)),
+                ('service_lat', models.FloatField()),
+                ('service_lng', models.FloatField()),
+                ('service_geohash', models.CharField(db_index=True, max_length=12)),
+                ('service_vicinity', models.CharField(blank=True, max_length=255)),
+                ('service_place_id', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('service_refreshed', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
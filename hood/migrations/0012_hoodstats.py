@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+from django.utils import timezone
+
+
+def fill_hood_stats(apps, schema_editor):
+    Hood = apps.get_model('hood', 'Hood')
+    HoodStats = apps.get_model('hood', 'HoodStats')
+    stats = {hood_id: HoodStats(stats_hood_id=hood_id, stats_reconciled=timezone.now())
+             for hood_id in Hood.objects.values_list('id', flat=True)}
+    sources = (
+        ('stats_members', apps.get_model('hood', 'Profile').objects.filter(email_confirmed=True), 'profile_hood'),
+        ('stats_posts', apps.get_model('hood', 'News').objects.all(), 'news_hood'),
+        ('stats_businesses', apps.get_model('hood', 'Business').objects.all(), 'business_hood'),
+    )
+    for field, queryset, hood_field in sources:
+        for hood_id, count in queryset.exclude(**{hood_field: None}).order_by().values_list(
+                hood_field).annotate(count=Count('id')):
+            setattr(stats[hood_id], field, count)
+    HoodStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0011_servicepoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HoodStats',
+            fields=[
+                ('stats_hood', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='hood.Hood')),
+                ('stats_members', models.IntegerField(default=0)),
+                ('stats_posts', models.IntegerField(default=0)),
+                ('stats_businesses', models.IntegerField(default=0)),
+                ('stats_reconciled', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_hood_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 16:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0012_hoodstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='loc_geocoded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 16:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hood', '0013_location_geocoded_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricSample',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_name', models.CharField(max_length=100)),
+                ('metric_labels', models.CharField(max_length=255)),
+                ('metric_field', models.CharField(max_length=20)),
+                ('metric_value', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='metricsample',
+            unique_together=set([('metric_name', 'metric_labels', 'metric_field')]),
+        ),
+    ]
@@ -1,8 +1,24 @@
-from django.db import models
-from django.db.models.signals import post_save
+import base64
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.dispatch import receiver
+from django.core.cache import cache
+from .cache import bump_version_on_commit, get_version, get_versions
+from . import geo, maps
+
+# Profile.counted_hood_id() of a profile loaded without its hood or email_confirmed fields
+DEFERRED = object()
+# text search configuration the search columns and their triggers are built with
+SEARCH_CONFIG = 'english'
+
 
 # Create your models here.
 class Profile(models.Model):
@@ -11,6 +27,7 @@ class Profile(models.Model):
     """
     profile_photo = models.ImageField(
         upload_to='profiles/', verbose_name='Pick Profile Pic', null=True)
+    profile_photo_ready = models.BooleanField(default=False)
     profile_owner = models.OneToOneField(User)
     profile_id = models.CharField(max_length=8, verbose_name="Id Number",
                                   validators=[
@@ -22,9 +39,52 @@ class Profile(models.Model):
     profile_hood = models.ForeignKey('Hood', null=True)
     email_confirmed = models.BooleanField(default=False)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the hood this profile is counted as a member of in HoodStats
+        self._counted_hood_id = self.counted_hood_id()
+        # the field values last read from or written to the database
+        self._saved_state = self.field_state()
+
     def __str__(self):
         return str(self.profile_owner)
 
+    def counted_hood_id(self):
+        """
+        method that returns the hood a confirmed profile is a member of, or DEFERRED when the fields
+        weren't loaded; read from __dict__ so deferred fields aren't fetched
+        """
+        if 'profile_hood_id' not in self.__dict__ or 'email_confirmed' not in self.__dict__:
+            return DEFERRED
+        return self.profile_hood_id if self.email_confirmed else None
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        state = self.field_state()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+            state = {attname: value for attname, value in state.items() if attname in saved}
+        self._saved_state.update(state)
+
+    def field_state(self):
+        """
+        method that returns the loaded field values by attname, with files as their names
+        """
+        state = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                state[field.attname] = getattr(value, 'name', value) if isinstance(field, models.FileField) else value
+        return state
+
+    def dirty_fields(self):
+        """
+        method that returns the attnames of the fields changed since the profile was loaded or saved
+        """
+        return [attname for attname, value in self.field_state().items()
+                if attname not in self._saved_state or self._saved_state[attname] != value]
+
     def save_profile(self):
         self.save()
 
@@ -43,14 +103,26 @@ class Profile(models.Model):
         """
         method that updates a user's profile photo
         """
-        cls.objects.filter(profile_owner=user_id).update(profile_photo=value)
+        profiles = cls.objects.filter(profile_owner=user_id)
+        profiles.update(profile_photo=value, profile_photo_ready=False)
+        bump_version_on_commit('auth-user', user_id)
+        for profile in profiles.only('id', 'profile_photo'):
+            ImageJob.queue(profile, 'profile_photo')
 
     @classmethod
     def update_profile_hood(cls, user_id, value):
         """
         method that updates a user's neighbourhood
         """
-        cls.objects.filter(profile_owner=user_id).update(profile_hood=value)
+        hood_id = getattr(value, 'pk', value)
+        with transaction.atomic():
+            profiles = cls.objects.select_for_update().filter(profile_owner=user_id)
+            counted = list(profiles.filter(email_confirmed=True).values_list('profile_hood', flat=True))
+            profiles.update(profile_hood=hood_id)
+            bump_version_on_commit('auth-user', user_id)
+            for old_hood_id in counted:
+                HoodStats.adjust(old_hood_id, stats_members=-1)
+                HoodStats.adjust(hood_id, stats_members=1)
 
     @classmethod
     def find_profile_by_name(cls, username):
@@ -60,6 +132,43 @@ class Profile(models.Model):
         profile = cls.objects.get(profile_owner__username=username)
         return profile
 
+    @classmethod
+    def find_request_profile(cls, user):
+        """
+        method that returns a user's profile with its hood and location in a single query
+        Returns None for anonymous users
+        """
+        if not user.is_authenticated:
+            return None
+        return cls.objects.select_related('profile_owner', 'profile_hood__hood_location').get(
+            profile_owner=user.id)
+
+    @classmethod
+    def find_cached_profile(cls, user_id):
+        """
+        method that returns a user's profile with its owner, hood and location from the cache
+        Entries expire after REQUEST_PROFILE_CACHE_TIMEOUT or as soon as the user, their profile or
+        their hood changes. Returns None for users without a profile
+        """
+        key = 'request-profile:{}'.format(user_id)
+        entry = cache.get(key)
+        if entry is not None:
+            user_version, hood_version, profile = entry
+            if get_versions([('auth-user', user_id), ('auth-hood', profile.profile_hood_id)]) == [
+                    user_version, hood_version]:
+                return profile
+
+        # read before loading so a change made meanwhile expires what gets cached
+        user_version = get_version('auth-user', user_id)
+        try:
+            profile = cls.objects.select_related('profile_owner', 'profile_hood__hood_location').get(
+                profile_owner=user_id)
+        except cls.DoesNotExist:
+            return None
+        hood_version = get_version('auth-hood', profile.profile_hood_id)
+        cache.set(key, (user_version, hood_version, profile), settings.REQUEST_PROFILE_CACHE_TIMEOUT)
+        return profile
+
     @classmethod
     def find_profile_by_userid(cls, user_id):
         """
@@ -76,7 +185,48 @@ def update_user_profile(sender, instance, created, **kwargs):
     """
     if created:
         Profile.objects.create(profile_owner=instance)
-    instance.profile.save()
+        return
+    # only a profile changed through user.profile is written, and only the fields that changed,
+    # so saves like the last_login update at login cost no profile queries
+    profile = getattr(instance, User.profile.cache_name, None)
+    if profile is not None:
+        dirty_fields = profile.dirty_fields()
+        if dirty_fields:
+            profile.save(update_fields=dirty_fields)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    method that expires the cached profile the auth backend loads a user with
+    """
+    bump_version_on_commit('auth-user', instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    bump_version_on_commit('auth-user', instance.profile_owner_id)
+
+
+@receiver(post_save, sender=Profile)
+def count_hood_member(sender, instance, **kwargs):
+    """
+    method that moves a profile's membership count when it joins a hood, changes hood or has its
+    email confirmed or soft deleted
+    """
+    counted_hood_id = instance.counted_hood_id()
+    if DEFERRED not in (counted_hood_id, instance._counted_hood_id) and counted_hood_id != instance._counted_hood_id:
+        HoodStats.adjust(instance._counted_hood_id, stats_members=-1)
+        HoodStats.adjust(counted_hood_id, stats_members=1)
+    instance._counted_hood_id = counted_hood_id
+
+
+@receiver(post_delete, sender=Profile)
+def uncount_hood_member(sender, instance, **kwargs):
+    if instance._counted_hood_id is not DEFERRED:
+        HoodStats.adjust(instance._counted_hood_id, stats_members=-1)
 
 
 class Hood(models.Model):
@@ -92,6 +242,9 @@ class Hood(models.Model):
 
     class Meta:
         ordering = ['hood_name']
+        indexes = [
+            models.Index(fields=['hood_location', 'hood_name']),
+        ]
 
     def create_hood(self):
         """
@@ -105,6 +258,41 @@ class Hood(models.Model):
         """
         self.delete()
 
+    @classmethod
+    def directory(cls):
+        """
+        method that returns every location with its hoods, for the select hood dropdown
+        """
+        locations = []
+        for hood in cls.objects.select_related('hood_location').only(
+                'id', 'hood_name', 'hood_location__id', 'hood_location__loc_name').order_by(
+                'hood_location__loc_name', 'hood_location_id', 'hood_name'):
+            if not locations or locations[-1]['id'] != hood.hood_location_id:
+                locations.append({'id': hood.hood_location_id, 'name': hood.hood_location.loc_name, 'hoods': []})
+            locations[-1]['hoods'].append({'id': hood.id, 'name': hood.hood_name})
+        return locations
+
+    @classmethod
+    def spatial_index(cls):
+        """
+        method that builds an in-process spatial index of every hood whose location has coordinates
+        """
+        index = geo.GridIndex(cell_size=settings.HOOD_GRID_CELL_SIZE)
+        hoods = cls.objects.filter(hood_location__loc_lat__isnull=False, hood_location__loc_lng__isnull=False)
+        for hood_id, name, location, lat, lng in hoods.values_list(
+                'id', 'hood_name', 'hood_location__loc_name', 'hood_location__loc_lat',
+                'hood_location__loc_lng').iterator():
+            index.add({'id': hood_id, 'name': name, 'location': location}, lat, lng)
+        return index
+
+    @classmethod
+    def nearby(cls, lat, lng, k=5):
+        """
+        method that returns the k hoods closest to a point as dicts with their distance in km
+        """
+        return [dict(hood, distance_km=round(distance, 2))
+                for distance, hood in HOOD_INDEX.get().nearest(lat, lng, k, settings.NEARBY_HOODS_MAX_KM)]
+
     @classmethod
     def find_hood(cls, hood_id):
         """
@@ -116,15 +304,204 @@ class Hood(models.Model):
         return found_hood
 
 
+# rebuilt whenever a hood or location changes
+HOOD_INDEX = geo.VersionedIndex(Hood.spatial_index, lambda: get_version('hood-directory', 'all'))
+
+
+class HoodStats(models.Model):
+    """
+    HoodStats class that keeps a hood's member, post and business counts so pages don't count rows
+    Counters move with F() updates from signals, reconcile rebuilds them when they drift
+    """
+    stats_hood = models.OneToOneField('Hood', primary_key=True, related_name='stats')
+    stats_members = models.IntegerField(default=0)
+    stats_posts = models.IntegerField(default=0)
+    stats_businesses = models.IntegerField(default=0)
+    stats_reconciled = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.stats_hood_id)
+
+    @classmethod
+    def adjust(cls, hood_id, **deltas):
+        """
+        method that atomically adds to a hood's counters, e.g. adjust(hood_id, stats_posts=1)
+        """
+        if hood_id is not None:
+            cls.objects.filter(stats_hood=hood_id).update(
+                **{field: F(field) + delta for field, delta in deltas.items()})
+
+    @classmethod
+    def for_hoods(cls, hood_ids):
+        """
+        method that returns the stats of several hoods by hood id
+        """
+        return cls.objects.in_bulk([hood_id for hood_id in hood_ids if hood_id is not None])
+
+    @classmethod
+    def reconcile(cls, hood_ids=None, chunk_size=500):
+        """
+        method that rebuilds the counters of some hoods, or every hood, from grouped counts
+        Returns:
+            the number of hoods reconciled
+        """
+        hoods = Hood.objects.all() if hood_ids is None else Hood.objects.filter(id__in=list(hood_ids))
+        ids = list(hoods.order_by('id').values_list('id', flat=True))
+        sources = (
+            ('stats_members', Profile.objects.filter(email_confirmed=True), 'profile_hood'),
+            ('stats_posts', News.objects.all(), 'news_hood'),
+            ('stats_businesses', Business.objects.all(), 'business_hood'),
+        )
+        now = timezone.now()
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            stats = {hood_id: cls(stats_hood_id=hood_id, stats_reconciled=now) for hood_id in chunk}
+            for field, queryset, hood_field in sources:
+                counts = queryset.filter(**{hood_field + '__in': chunk}).order_by().values_list(
+                    hood_field).annotate(count=Count('id'))
+                for hood_id, count in counts:
+                    setattr(stats[hood_id], field, count)
+            with transaction.atomic():
+                cls.objects.filter(stats_hood__in=chunk).delete()
+                cls.objects.bulk_create(stats.values())
+        return len(ids)
+
+
+@receiver(post_save, sender=Hood)
+def create_hood_stats(sender, instance, created, **kwargs):
+    if created:
+        HoodStats.objects.create(stats_hood=instance)
+
+
+@receiver(post_save, sender=Hood)
+@receiver(post_delete, sender=Hood)
+def invalidate_hood_directory(sender, instance, **kwargs):
+    """
+    method that expires the cached location to hoods map used by the select hood dropdown
+    """
+    bump_version_on_commit('hood-directory', 'all')
+
+
+@receiver(post_save, sender=Hood)
+@receiver(post_delete, sender=Hood)
+def invalidate_cached_hood(sender, instance, **kwargs):
+    """
+    method that expires the cached profiles of a hood's members
+    """
+    bump_version_on_commit('auth-hood', instance.pk)
+
+
 class Location(models.Model):
     """
     Location class that defines objects of each location
     """
     loc_name = models.CharField(max_length=255, verbose_name="Pick your Location")
+    loc_lat = models.FloatField(null=True, blank=True)
+    loc_lng = models.FloatField(null=True, blank=True)
+    loc_geohash = models.CharField(max_length=12, blank=True, db_index=True)
+    # when loc_name was last sent to the geocode api, whether or not it resolved
+    loc_geocoded_at = models.DateTimeField(null=True, blank=True)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the name the stored coordinates, or failed attempt, belong to; read from __dict__ so
+        # deferred fields aren't fetched
+        if self.__dict__.get('loc_lat') is not None or self.__dict__.get('loc_geocoded_at') is not None:
+            self._geocoded_name = self.__dict__.get('loc_name')
+        else:
+            self._geocoded_name = None
 
     def __str__(self):
         return str(self.loc_name)
 
+    def save(self, *args, **kwargs):
+        """
+        method that geocodes the location when it is new or its name has changed before saving it
+        Names the geocode api couldn't resolve are retried by geocode_pending, not on every save
+        """
+        if self.loc_name != self._geocoded_name:
+            self.geocode_location()
+        self.update_geohash()
+        super().save(*args, **kwargs)
+
+    def geocode_location(self):
+        """
+        method that resolves the location's name into coordinates, recording the attempt
+        """
+        coordinates = maps.geocode(self.loc_name)
+        if coordinates is None:
+            self.loc_lat = self.loc_lng = None
+        else:
+            self.loc_lat = coordinates['lat']
+            self.loc_lng = coordinates['lng']
+        self.loc_geocoded_at = timezone.now()
+        self._geocoded_name = self.loc_name
+
+    @classmethod
+    def geocode_pending(cls, retry_after=None, limit=100):
+        """
+        method that geocodes locations without coordinates whose last attempt is older than
+        retry_after seconds, GEOCODE_RETRY_AFTER by default
+        Results are written with update() so only the caches of locations that resolved expire.
+        Returns:
+            the number of locations attempted and the number that resolved
+        """
+        if retry_after is None:
+            retry_after = settings.GEOCODE_RETRY_AFTER
+        due = timezone.now() - timedelta(seconds=retry_after)
+        pending = cls.objects.filter(loc_lat__isnull=True).filter(
+            Q(loc_geocoded_at__isnull=True) | Q(loc_geocoded_at__lt=due)).order_by('loc_geocoded_at', 'id')[:limit]
+
+        resolved = []
+        attempted = 0
+        for location in pending:
+            location.geocode_location()
+            location.update_geohash()
+            cls.objects.filter(id=location.id).update(loc_lat=location.loc_lat, loc_lng=location.loc_lng,
+                                                      loc_geohash=location.loc_geohash,
+                                                      loc_geocoded_at=location.loc_geocoded_at)
+            attempted += 1
+            if location.coordinates is not None:
+                resolved.append(location.id)
+
+        if resolved:
+            bump_version_on_commit('hood-directory', 'all')
+            for hood_id in Hood.objects.filter(hood_location__in=resolved).values_list('id', flat=True):
+                bump_version_on_commit('auth-hood', hood_id)
+        return attempted, len(resolved)
+
+    def update_geohash(self):
+        """
+        method that encodes the location's coordinates so nearby locations share a loc_geohash prefix
+        """
+        if self.loc_lat is None or self.loc_lng is None:
+            self.loc_geohash = ''
+        else:
+            self.loc_geohash = geo.geohash_encode(self.loc_lat, self.loc_lng)
+
+    @property
+    def coordinates(self):
+        """
+        the location's coordinates in the {'lat': ..., 'lng': ...} form the maps apis expect
+        """
+        if self.loc_lat is None or self.loc_lng is None:
+            return None
+        return {'lat': self.loc_lat, 'lng': self.loc_lng}
+
+
+post_save.connect(invalidate_hood_directory, sender=Location)
+post_delete.connect(invalidate_hood_directory, sender=Location)
+
+
+@receiver(post_save, sender=Location)
+def invalidate_location_hoods(sender, instance, created, **kwargs):
+    """
+    method that expires the cached profiles of the members of a location's hoods
+    """
+    if not created:
+        for hood_id in instance.hood_set.values_list('id', flat=True):
+            bump_version_on_commit('auth-hood', hood_id)
+
 
 class Business(models.Model):
     """
@@ -148,6 +525,13 @@ class Business(models.Model):
     business_hood = models.ForeignKey('Hood')
     business_description = models.CharField(max_length=100, null=True, blank=True)
     business_email = models.EmailField()
+    business_updated = models.DateTimeField(auto_now=True)
+    business_search = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business_hood', 'business_category']),
+        ]
 
     def create_business(self):
         """
@@ -169,6 +553,80 @@ class Business(models.Model):
         found_business = cls.objects.get(id=business_id)
         return found_business
 
+    @classmethod
+    def listing(cls):
+        """
+        method that returns businesses with their owner loaded in the same query
+        """
+        return cls.objects.select_related('business_owner__profile_owner').only(
+            'id', 'business_name', 'business_category', 'business_description', 'business_email',
+            'business_hood', 'business_owner', 'business_owner__profile_photo',
+            'business_owner__profile_photo_ready',
+            'business_owner__profile_owner__username')
+
+    @classmethod
+    def search(cls, hood_id, terms):
+        """
+        method that returns a hood's businesses matching search terms, best matches first
+        business_search is kept up to date by a database trigger, names weigh more than descriptions
+        """
+        query = SearchQuery(terms, config=SEARCH_CONFIG)
+        return cls.listing().filter(business_hood=hood_id, business_search=query).annotate(
+            rank=SearchRank(models.F('business_search'), query)).order_by('-rank', 'business_name', 'id')
+
+    @classmethod
+    def category_counts(cls, hood_id):
+        """
+        method that returns the number of businesses in each category of a hood, in one query
+        Returns:
+            a list of {'category', 'label', 'count'} dicts in BUSINESS_CHOICES order
+        """
+        counts = dict(cls.objects.filter(business_hood=hood_id).values_list('business_category').annotate(
+            count=models.Count('id')).order_by())
+        return [{'category': category, 'label': label, 'count': counts.get(category, 0)}
+                for category, label in cls.BUSINESS_CHOICES]
+
+    @classmethod
+    def change_stamp(cls, **filters):
+        """
+        method that returns a value that changes whenever a business matching filters is added,
+        updated or deleted
+        """
+        stamp = cls.objects.filter(**filters).aggregate(updated=models.Max('business_updated'),
+                                                         count=models.Count('id'))
+        return stamp['updated'], stamp['count']
+
+    @classmethod
+    def hood_businesses(cls, hood_id):
+        """
+        method that returns every business in a hood
+        """
+        return cls.listing().filter(business_hood=hood_id)
+
+    @classmethod
+    def owner_businesses(cls, profile_id):
+        """
+        method that returns the businesses a profile owns
+        """
+        return cls.listing().filter(business_owner=profile_id)
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_delete, sender=Business)
+def invalidate_business_facets(sender, instance, **kwargs):
+    """
+    method that expires the cached category counts of a business's hood
+    """
+    bump_version_on_commit('hood-businesses', instance.business_hood_id)
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_delete, sender=Business)
+def count_hood_business(sender, instance, created=None, **kwargs):
+    # created is None for deletes
+    if created is not False:
+        HoodStats.adjust(instance.business_hood_id, stats_businesses=1 if created else -1)
+
 
 class News(models.Model):
     """
@@ -176,12 +634,14 @@ class News(models.Model):
     """
     news_footage = models.ImageField(
         upload_to='footages/', verbose_name="Attach Footage", null=True, blank=True)
+    news_footage_ready = models.BooleanField(default=False)
     news_details = models.TextField()
     news_created_by = models.ForeignKey('Profile', verbose_name='Created By', related_name='owner')
     news_hood = models.ForeignKey('Hood')
     # news_comments = models.ManyToManyField('Profile', default=False, through='Comment', through_fields=(
     #     'comment_image', 'comment_owner'))
     news_pub_date = models.DateTimeField(auto_now_add=True)
+    news_search = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return str(self.news_details[:50])
@@ -192,6 +652,9 @@ class News(models.Model):
         """
         ordering = ['-news_pub_date']
         verbose_name_plural = 'news'
+        indexes = [
+            models.Index(fields=['news_hood', '-news_pub_date', '-id']),
+        ]
 
     def save_news(self):
         """
@@ -203,4 +666,356 @@ class News(models.Model):
         """
         methods that deletes an instance of news
         """
-        self.delete()
\ No newline at end of file
+        self.delete()
+
+    @classmethod
+    def listing(cls):
+        """
+        method that returns news with its author and hood loaded in the same query
+        """
+        return cls.objects.select_related('news_created_by__profile_owner', 'news_hood').only(
+            'id', 'news_details', 'news_footage', 'news_footage_ready', 'news_pub_date', 'news_hood',
+            'news_hood__hood_name', 'news_created_by', 'news_created_by__profile_photo',
+            'news_created_by__profile_photo_ready', 'news_created_by__profile_owner__username')
+
+    @classmethod
+    def search(cls, hood_id, terms):
+        """
+        method that returns a hood's news matching search terms, best matches first
+        news_search is kept up to date by a database trigger
+        """
+        query = SearchQuery(terms, config=SEARCH_CONFIG)
+        return cls.listing().filter(news_hood=hood_id, news_search=query).annotate(
+            rank=SearchRank(models.F('news_search'), query)).order_by('-rank', '-news_pub_date', '-id')
+
+    @classmethod
+    def hood_feed(cls, hood_id, cursor=None, limit=None):
+        """
+        method that returns one page of a hood's news, newest first
+        Pages are keyset paginated on (news_pub_date, id) so deep pages cost the same as the first
+        Args:
+            hood_id
+            cursor: the next_cursor of the previous page, None for the first page
+        Returns:
+            a (news list, next_cursor) tuple, next_cursor is None on the last page
+        Raises:
+            ValueError: if the cursor is malformed
+        """
+        limit = limit or settings.NEWS_FEED_PAGE_SIZE
+        news = cls.listing().filter(news_hood=hood_id).order_by('-news_pub_date', '-id')
+        if cursor:
+            pub_date, news_id = cls.decode_cursor(cursor)
+            news = news.filter(Q(news_pub_date__lt=pub_date) | Q(news_pub_date=pub_date, id__lt=news_id))
+
+        page = list(news[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = cls.encode_cursor(page[-1])
+        return page, next_cursor
+
+    @staticmethod
+    def encode_cursor(news):
+        position = '{}|{}'.format(news.news_pub_date.isoformat(), news.id)
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            pub_date, news_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            pub_date = parse_datetime(pub_date)
+            news_id = int(news_id)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError('Invalid feed cursor')
+        if pub_date is None:
+            raise ValueError('Invalid feed cursor')
+        return pub_date, news_id
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def invalidate_hood_feed(sender, instance, **kwargs):
+    """
+    method that expires the cached feed of the hood a news item belongs to
+    """
+    bump_version_on_commit('hood-feed', instance.news_hood_id)
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def count_hood_post(sender, instance, created=None, **kwargs):
+    # created is None for deletes
+    if created is not False:
+        HoodStats.adjust(instance.news_hood_id, stats_posts=1 if created else -1)
+
+
+class OutgoingEmail(models.Model):
+    """
+    OutgoingEmail class that defines emails queued for delivery by the send_queued_mail command
+    """
+    PENDING = 'P'
+    SENT = 'S'
+    DEAD = 'D'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    )
+    email_subject = models.CharField(max_length=255)
+    email_body = models.TextField()
+    email_from = models.CharField(max_length=254, blank=True)
+    email_to = models.EmailField()
+    email_status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    email_attempts = models.PositiveSmallIntegerField(default=0)
+    email_next_attempt = models.DateTimeField(default=timezone.now)
+    email_last_error = models.TextField(blank=True)
+    email_created = models.DateTimeField(auto_now_add=True)
+    email_sent = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.email_subject)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['email_status', 'email_next_attempt']),
+        ]
+
+    @classmethod
+    def queue(cls, subject, body, to, from_email=''):
+        """
+        method that queues an email, it is sent by the next send_queued_mail run
+        """
+        return cls.objects.create(email_subject=subject, email_body=body, email_to=to, email_from=from_email)
+
+    @classmethod
+    def due(cls):
+        """
+        method that returns pending emails whose next attempt is due, oldest first
+        """
+        return cls.objects.filter(email_status=cls.PENDING,
+                                  email_next_attempt__lte=timezone.now()).order_by('email_next_attempt', 'id')
+
+    def mark_sent(self):
+        self.email_status = self.SENT
+        self.email_attempts += 1
+        self.email_sent = timezone.now()
+        self.email_last_error = ''
+        self.save(update_fields=['email_status', 'email_attempts', 'email_sent', 'email_last_error'])
+
+    def mark_failed(self, error):
+        """
+        method that schedules a retry with exponential backoff, or dead-letters the email once
+        EMAIL_OUTBOX_MAX_ATTEMPTS is reached
+        """
+        self.email_attempts += 1
+        self.email_last_error = str(error)
+        if self.email_attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            self.email_status = self.DEAD
+        else:
+            delay = min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (self.email_attempts - 1),
+                        settings.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+            self.email_next_attempt = timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['email_status', 'email_attempts', 'email_last_error', 'email_next_attempt'])
+
+
+
+class ImageJob(models.Model):
+    """
+    ImageJob class that defines uploaded images waiting for the process_image_jobs worker
+    """
+    PENDING = 'P'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    FIELD_CHOICES = (
+        ('news_footage', 'News footage'),
+        ('profile_photo', 'Profile photo'),
+    )
+    job_field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    job_object_id = models.PositiveIntegerField()
+    job_image = models.CharField(max_length=255)
+    job_status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    job_attempts = models.PositiveSmallIntegerField(default=0)
+    job_last_error = models.TextField(blank=True)
+    job_created = models.DateTimeField(auto_now_add=True)
+    job_claimed = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.job_image)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job_status', 'job_created']),
+        ]
+
+    HOOD_FIELDS = {'news_footage': 'news_hood', 'profile_photo': 'profile_hood'}
+
+    @staticmethod
+    def field_model(field_name):
+        return {'news_footage': News, 'profile_photo': Profile}[field_name]
+
+    @classmethod
+    def queue(cls, instance, field_name):
+        """
+        method that queues an instance's uploaded image for processing
+        """
+        image = getattr(instance, field_name)
+        if not image:
+            return None
+        return cls.objects.create(job_field=field_name, job_object_id=instance.id, job_image=image.name)
+
+    @classmethod
+    def claim(cls, batch_size):
+        """
+        method that marks a batch of pending jobs, and running jobs whose worker died, as running
+        Returns:
+            the claimed jobs
+        """
+        stuck = timezone.now() - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT)
+        with transaction.atomic():
+            jobs = list(cls.objects.filter(Q(job_status=cls.PENDING) | Q(job_status=cls.RUNNING, job_claimed__lt=stuck))
+                        .order_by('job_created').select_for_update(skip_locked=True)[:batch_size])
+            cls.objects.filter(id__in=[job.id for job in jobs]).update(job_status=cls.RUNNING,
+                                                                        job_claimed=timezone.now())
+        return jobs
+
+    def mark_done(self, processed_name):
+        """
+        method that points the instance at its processed image and marks its renditions as ready
+        An instance whose image was replaced since the job was queued is left to its newer job
+        Returns:
+            True when the instance now points at the processed image
+        """
+        model = self.field_model(self.job_field)
+        instances = model.objects.filter(**{'id': self.job_object_id, self.job_field: self.job_image})
+        hood_id = instances.values_list(self.HOOD_FIELDS[self.job_field], flat=True).first()
+        swapped = bool(instances.update(**{self.job_field: processed_name, self.job_field + '_ready': True}))
+        if swapped:
+            if hood_id:
+                # cached feeds still show the placeholder
+                bump_version_on_commit('hood-feed', hood_id)
+            if model is Profile:
+                owner_id = model.objects.filter(id=self.job_object_id).values_list('profile_owner', flat=True).first()
+                bump_version_on_commit('auth-user', owner_id)
+        self.job_status = self.DONE
+        self.job_attempts += 1
+        self.job_last_error = ''
+        self.save(update_fields=['job_status', 'job_attempts', 'job_last_error'])
+        return swapped
+
+    def mark_failed(self, error):
+        """
+        method that puts the job back in the queue until IMAGE_JOB_MAX_ATTEMPTS is reached
+        """
+        self.job_attempts += 1
+        self.job_last_error = str(error)
+        self.job_status = self.FAILED if self.job_attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS else self.PENDING
+        self.save(update_fields=['job_status', 'job_attempts', 'job_last_error'])
+
+
+
+class ServicePoint(models.Model):
+    """
+    ServicePoint class that defines the police stations and hospitals shown on hood dashboards
+    Filled by the refresh_service_points command so dashboards don't call the places api
+    """
+    KIND_CHOICES = (
+        ('police', 'Police'),
+        ('hospital', 'Hospital'),
+    )
+    service_name = models.CharField(max_length=255)
+    service_kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    service_lat = models.FloatField()
+    service_lng = models.FloatField()
+    service_geohash = models.CharField(max_length=12, db_index=True)
+    service_vicinity = models.CharField(max_length=255, blank=True)
+    service_place_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    service_refreshed = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.service_name)
+
+    def save(self, *args, **kwargs):
+        self.service_geohash = geo.geohash_encode(self.service_lat, self.service_lng)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def spatial_index(cls):
+        """
+        method that builds an in-process spatial index of service points for each kind
+        """
+        indexes = {kind: geo.GridIndex(cell_size=settings.HOOD_GRID_CELL_SIZE) for kind, _ in cls.KIND_CHOICES}
+        for point in cls.objects.all().iterator():
+            indexes[point.service_kind].add(point.as_place(), point.service_lat, point.service_lng)
+        return indexes
+
+    @classmethod
+    def nearest(cls, coordinates, kind, count=None):
+        """
+        method that returns the service points of a kind closest to some coordinates
+        Returns:
+            a list shaped like places api results, each with its distance_km
+        """
+        count = count or settings.SERVICE_POINTS_PER_HOOD
+        index = SERVICE_POINT_INDEX.get()[kind]
+        return [dict(place, distance_km=round(distance, 2)) for distance, place in
+                index.nearest(coordinates['lat'], coordinates['lng'], count, settings.SERVICE_POINTS_MAX_KM)]
+
+    def as_place(self):
+        return {
+            'name': self.service_name,
+            'vicinity': self.service_vicinity,
+            'place_id': self.service_place_id,
+            'geometry': {'location': {'lat': self.service_lat, 'lng': self.service_lng}},
+        }
+
+
+@receiver(post_save, sender=ServicePoint)
+@receiver(post_delete, sender=ServicePoint)
+def invalidate_service_points(sender, instance, **kwargs):
+    """
+    method that expires the service point index
+    """
+    bump_version_on_commit('service-points', 'all')
+
+
+# rebuilt whenever a service point changes
+SERVICE_POINT_INDEX = geo.VersionedIndex(ServicePoint.spatial_index, lambda: get_version('service-points', 'all'))
+
+
+class MetricSample(models.Model):
+    """
+    MetricSample class that defines the request metrics every worker has flushed, one row per
+    histogram bucket, sum and count of each label set
+    """
+    metric_name = models.CharField(max_length=100)
+    metric_labels = models.CharField(max_length=255)
+    metric_field = models.CharField(max_length=20)
+    metric_value = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('metric_name', 'metric_labels', 'metric_field')
+
+    def __str__(self):
+        return '{}{} {}'.format(self.metric_name, self.metric_labels, self.metric_field)
+
+    @classmethod
+    def add(cls, name, labels, field, value):
+        """
+        method that adds a value to a row, creating it the first time any worker flushes it
+        """
+        rows = cls.objects.filter(metric_name=name, metric_labels=labels, metric_field=field)
+        if rows.update(metric_value=F('metric_value') + value):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(metric_name=name, metric_labels=labels, metric_field=field, metric_value=value)
+        except IntegrityError:
+            # another worker created it first
+            rows.update(metric_value=F('metric_value') + value)
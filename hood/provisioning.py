@@ -0,0 +1,92 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .directory import RecordError, chunked
+from .models import Profile, Hood, HoodStats
+
+
+class MemberProvisioner:
+    """
+    Provisioner that bulk creates active, confirmed members of existing hoods, e.g. a whole estate
+    Each chunk is written with one bulk_create of users and one of profiles inside a transaction,
+    skipping the per-row signals a User save fires, so hood counters are reconciled at the end.
+    Records have username, hood, email, first_name, last_name, password and profile_id columns.
+    Members without a password get an unusable one and set theirs by resetting it.
+    """
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.errors = []
+        self.touched_hoods = set()
+        self.hoods = {}
+        for hood_id, name in Hood.objects.values_list('id', 'hood_name'):
+            # hood names aren't unique, a name used by two hoods can't be resolved
+            self.hoods[name] = None if name in self.hoods else hood_id
+
+    def run(self, records):
+        for chunk in chunked(records, self.chunk_size):
+            with transaction.atomic():
+                self.provision_chunk(chunk)
+        HoodStats.reconcile(self.touched_hoods)
+        return self.created, self.errors
+
+    def provision_chunk(self, chunk):
+        usernames = [str(record.get('username', '')).strip() for _, record in chunk]
+        taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        members = []
+        for line, record in chunk:
+            try:
+                user, profile = self.build_member(record, taken)
+            except (RecordError, ValidationError) as error:
+                message = '; '.join(error.messages) if isinstance(error, ValidationError) else str(error)
+                self.errors.append((line, message))
+            else:
+                taken.add(user.username)
+                members.append((user, profile))
+        if not members:
+            return
+
+        users = User.objects.bulk_create([user for user, _ in members])
+        if any(user.id is None for user in users):
+            # only postgresql returns the ids of bulk created rows
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list(
+                'username', 'id'))
+            for user in users:
+                user.id = ids[user.username]
+        for user, profile in members:
+            profile.profile_owner_id = user.id
+        Profile.objects.bulk_create([profile for _, profile in members])
+        self.touched_hoods.update(profile.profile_hood_id for _, profile in members)
+        self.created += len(members)
+
+    def build_member(self, record, taken):
+        username = self.required(record, 'username')
+        if username in taken:
+            raise RecordError('username {!r} is taken'.format(username))
+        hood_name = self.required(record, 'hood')
+        hood_id = self.hoods.get(hood_name)
+        if hood_id is None:
+            reason = 'is ambiguous' if hood_name in self.hoods else 'does not exist'
+            raise RecordError('hood {!r} {}'.format(hood_name, reason))
+
+        password = record.get('password')
+        user = User(username=username, email=record.get('email', ''), first_name=record.get('first_name', ''),
+                    last_name=record.get('last_name', ''), is_active=True,
+                    password=make_password(str(password) if password is not None else None))
+        user.clean_fields(exclude=['password'])
+        profile = Profile(profile_id=str(record.get('profile_id', '')), profile_hood_id=hood_id, email_confirmed=True)
+        # members fill in their id number later, like members who sign up
+        exclude = ['profile_owner', 'profile_hood', 'profile_photo']
+        if 'profile_id' not in record:
+            exclude.append('profile_id')
+        profile.clean_fields(exclude=exclude)
+        return user, profile
+
+    @staticmethod
+    def required(record, field):
+        value = record.get(field)
+        if value is None:
+            raise RecordError('missing {}'.format(field))
+        return str(value).strip()
@@ -0,0 +1,144 @@
+import csv
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from . import geo, maps
+from .cache import bump_version
+from .directory import chunked
+from .models import Location, ServicePoint
+
+KINDS = tuple(kind for kind, _ in ServicePoint.KIND_CHOICES)
+# locations whose geohashes share this many characters (about 5km) are refreshed with one lookup
+REFRESH_PRECISION = 5
+
+
+def nearby_services(coordinates):
+    """
+    function that returns the police stations and hospitals closest to some coordinates from the
+    local directory, with the live places lookup only for kinds the directory has nothing for
+    when SERVICE_POINTS_LIVE_FALLBACK is on
+    Returns:
+        a {kind: {'results': [...]}} dict like maps.nearby_services
+    """
+    services = {kind: {'results': ServicePoint.nearest(coordinates, kind)} for kind in KINDS}
+    if settings.SERVICE_POINTS_LIVE_FALLBACK:
+        missing = tuple(kind for kind in KINDS if not services[kind]['results'])
+        if missing:
+            services.update(maps.nearby_services(coordinates, missing))
+    return services
+
+
+def refresh_centres():
+    """
+    function that returns one point per geohash cell holding a geocoded location
+    """
+    centres = {}
+    locations = Location.objects.exclude(loc_lat=None).exclude(loc_lng=None).values_list(
+        'loc_geohash', 'loc_lat', 'loc_lng')
+    for geohash, lat, lng in locations.iterator():
+        centres.setdefault(geohash[:REFRESH_PRECISION], {'lat': lat, 'lng': lng})
+    return list(centres.values())
+
+
+def uncovered_centres(kinds=KINDS):
+    """
+    function that returns the refresh centres missing a kind within SERVICE_POINTS_MAX_KM, e.g. around
+    new hoods, skipping centres already looked up in the last SERVICE_POINTS_REFRESH_SECONDS
+    """
+    uncovered = []
+    for centre in refresh_centres():
+        if all(ServicePoint.nearest(centre, kind, 1) for kind in kinds):
+            continue
+        key = 'service-points-checked:{:.3f},{:.3f}'.format(centre['lat'], centre['lng'])
+        if cache.add(key, True, settings.SERVICE_POINTS_REFRESH_SECONDS):
+            uncovered.append(centre)
+    return uncovered
+
+
+def places_records(kinds=KINDS, centres=None):
+    """
+    function that lazily queries the places api around some centres, every hood's by default, for
+    service point records
+    """
+    for coordinates in refresh_centres() if centres is None else centres:
+        for kind in kinds:
+            for place in maps.places_nearby(coordinates, kind, open_now=False).get('results', []):
+                location = place['geometry']['location']
+                yield {'kind': kind, 'name': place['name'], 'lat': location['lat'], 'lng': location['lng'],
+                       'vicinity': place.get('vicinity', ''), 'place_id': place['place_id']}
+
+
+def csv_records(stream):
+    """
+    function that lazily reads service point records from a csv with name, kind, lat, lng and
+    optional vicinity and place_id columns
+    """
+    for row in csv.DictReader(stream):
+        yield {key: value for key, value in row.items() if value not in (None, '')}
+
+
+def build_point(record):
+    kind = record.get('kind')
+    if kind not in KINDS:
+        raise ValueError('unknown service kind {!r}'.format(kind))
+    lat, lng = float(record['lat']), float(record['lng'])
+    geohash = geo.geohash_encode(lat, lng)
+    name = str(record['name']).strip()
+    # rows without a places id are keyed by where they are so reloading a csv updates them
+    place_id = record.get('place_id') or 'local:{}:{}:{}'.format(kind, geohash, name)
+    return ServicePoint(service_name=name, service_kind=kind, service_lat=lat, service_lng=lng,
+                        service_geohash=geohash, service_vicinity=record.get('vicinity', ''),
+                        service_place_id=place_id)
+
+
+def refresh_service_points(records, prune_kinds=()):
+    """
+    function that upserts service points by place id, stamping every point seen as refreshed
+    Points of prune_kinds the records didn't include are deleted, so only pass them for a full
+    refresh; points without a places id, from a csv or added by hand, are kept.
+    bulk_create and update() skip signals, so the spatial index is expired once at the end
+    Returns:
+        a (created, updated, deleted, errors) tuple, errors being (record number, message) pairs
+    """
+    points = {}
+    errors = []
+    for number, record in enumerate(records, 1):
+        try:
+            point = build_point(record)
+        except (KeyError, ValueError) as error:
+            errors.append((number, str(error)))
+        else:
+            # the same place turns up around neighbouring hoods
+            points[point.service_place_id] = point
+
+    fields = ('service_name', 'service_kind', 'service_lat', 'service_lng', 'service_geohash', 'service_vicinity')
+    updated = 0
+    # update() doesn't fill auto_now fields
+    refreshed = timezone.now()
+    with transaction.atomic():
+        for place_ids in chunked(list(points), 500):
+            existing = ServicePoint.objects.filter(service_place_id__in=place_ids).values_list(
+                'service_place_id', *fields)
+            unchanged = []
+            for place_id, *values in existing:
+                point = points.pop(place_id)
+                changes = {field: getattr(point, field) for field, value in zip(fields, values)
+                           if getattr(point, field) != value}
+                if changes:
+                    ServicePoint.objects.filter(service_place_id=place_id).update(service_refreshed=refreshed,
+                                                                                  **changes)
+                    updated += 1
+                else:
+                    unchanged.append(place_id)
+            ServicePoint.objects.filter(service_place_id__in=unchanged).update(service_refreshed=refreshed)
+        ServicePoint.objects.bulk_create(points.values(), batch_size=500)
+        deleted = 0
+        if prune_kinds:
+            missing = ServicePoint.objects.filter(service_kind__in=prune_kinds, service_refreshed__lt=refreshed,
+                                                  service_place_id__isnull=False)
+            deleted, _ = missing.exclude(service_place_id__startswith='local:').delete()
+
+    if points or updated or deleted:
+        bump_version('service-points', 'all')
+    return len(points), updated, deleted, errors
@@ -0,0 +1,39 @@
+from django import template
+from django.conf import settings
+from ..images import rendition_urls
+
+register = template.Library()
+
+
+def closest_width(width):
+    return min(settings.IMAGE_RENDITION_WIDTHS, key=lambda rendition_width: abs(rendition_width - int(width)))
+
+
+@register.filter
+def rendition(image, width):
+    """
+    filter that returns the url of an image's jpeg rendition closest to a width
+    Usage: {{ news.news_footage|rendition:640 }}
+    """
+    urls = rendition_urls(image)
+    if not urls:
+        return ''
+    return urls[closest_width(width)]['jpg']
+
+
+@register.inclusion_tag('hood/picture.html')
+def picture(image, width, alt=''):
+    """
+    tag that renders a <picture> serving webp renditions with jpeg as the fallback, or a
+    placeholder while the image is still being processed
+    Usage: {% picture news.news_footage 640 alt="footage" %}
+    """
+    urls = rendition_urls(image)
+    return {
+        'image': image,
+        'src': urls[closest_width(width)]['jpg'] if urls else '',
+        'webp_srcset': ', '.join('{} {}w'.format(url['webp'], width) for width, url in sorted(urls.items())),
+        'jpg_srcset': ', '.join('{} {}w'.format(url['jpg'], width) for width, url in sorted(urls.items())),
+        'sizes': '(max-width: {0}px) 100vw, {0}px'.format(width),
+        'alt': alt,
+    }
@@ -1,3 +1,1334 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.db import connection
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .cache import TTLCache, shared_cache_warning
+from .checks import check_shared_cache
+from .geo import GridIndex, distance_km, geohash_encode
+from .images import process_image, rendition_name, rendition_urls, run_image_jobs
+from .mail import deliver_queued_emails
+from .middleware import HoodProfileMiddleware
+from .models import (Profile, Hood, HoodStats, Location, Business, News, OutgoingEmail, ImageJob, ServicePoint,
+                     MetricSample)
+from . import bench, hub, maps, metrics, services, views
 
-# Create your tests here.
+
+def create_hood(hood_name, username):
+    """
+    helper that creates a hood, its location and its admin without calling the geocode api
+    """
+    user = User.objects.create_user(username=username, password='hood-pass-123')
+    with mock.patch.object(maps, 'geocode', return_value={'lat': -1.28, 'lng': 36.82}):
+        location = Location.objects.create(loc_name=hood_name + ' Location')
+    hood = Hood.objects.create(hood_name=hood_name, hood_location=location, hood_admin=user.profile)
+    Profile.objects.filter(profile_owner=user).update(profile_hood=hood, profile_id='12345678')
+    return hood, Profile.objects.get(profile_owner=user)
+
+
+MEMORY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SHARED_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyLibMCCache',
+                            'LOCATION': '127.0.0.1:11211'}}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTestClass(SimpleTestCase):
+    """
+    Test class that tests the TTLCache used for nearby lookups
+    """
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, stale_ttl=20, clock=self.clock)
+        self.calls = []
+
+    def loader(self, value):
+        def load():
+            self.calls.append(value)
+            return value
+        return load
+
+    def test_fresh_value_is_served_from_cache(self):
+        self.cache.get_or_load('police', self.loader(1))
+        self.clock.now = 5
+        self.assertEqual(self.cache.get_or_load('police', self.loader(2)), 1)
+        self.assertEqual(self.calls, [1])
+
+    def test_stale_value_is_served_while_revalidating(self):
+        self.cache.get_or_load('police', self.loader(1))
+        self.clock.now = 15
+        self.cache._refresh_in_background = lambda key, loader: self.cache.set(key, loader())
+        self.assertEqual(self.cache.get_or_load('police', self.loader(2)), 1)
+        self.assertEqual(self.cache.get('police'), 2)
+
+    def test_expired_value_is_reloaded_inline(self):
+        self.cache.get_or_load('police', self.loader(1))
+        self.clock.now = 31
+        self.assertEqual(self.cache.get_or_load('police', self.loader(2)), 2)
+
+    def test_concurrent_misses_share_one_load(self):
+        started, release = threading.Event(), threading.Event()
+
+        def load():
+            self.calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'police'
+
+        with ThreadPoolExecutor(4) as pool:
+            results = [pool.submit(self.cache.get_or_load, 'police', load) for _ in range(4)]
+            started.wait(5)
+            time.sleep(0.05)
+            release.set()
+            self.assertEqual([result.result() for result in results], ['police'] * 4)
+        self.assertEqual(self.calls, [1])
+
+    def test_failed_load_is_not_retried_until_failure_ttl(self):
+        self.cache.failure_ttl = 30
+        failing = mock.Mock(side_effect=ValueError('quota exceeded'))
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.cache.get_or_load('police', failing)
+        self.assertEqual(failing.call_count, 1)
+        self.assertIn('police', self.cache)
+
+        self.clock.now = 30
+        self.assertEqual(self.cache.get_or_load('police', self.loader(1)), 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('police', 1)
+        self.cache.set('hospital', 2)
+        self.cache.get('police')
+        self.cache.set('fire', 3)
+        self.assertIsNone(self.cache.get('hospital'))
+        self.assertEqual(self.cache.get('police'), 1)
+
+
+class SlowMapsHandler(BaseHTTPRequestHandler):
+    """
+    Stub of the google maps apis that answers after a configurable delay
+    """
+    delay = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({'results': [{'geometry': {'location': {'lat': -1.28, 'lng': 36.82}}}]})
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode())
+        except BrokenPipeError:
+            # the client timed out and hung up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class MapsTestClass(SimpleTestCase):
+    """
+    Test class that tests external lookups against a local stub server
+    """
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), SlowMapsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.geocode_url = 'http://127.0.0.1:{}/geocode?address={{}}&key={{}}'.format(self.server.server_port)
+        maps.get_nearby_cache().clear()
+
+    def tearDown(self):
+        SlowMapsHandler.delay = 0
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_geocode(self):
+        with self.settings(GEOCODE_URL=self.geocode_url):
+            self.assertEqual(maps.geocode('Kilimani'), {'lat': -1.28, 'lng': 36.82})
+
+    def test_slow_geocode_times_out(self):
+        SlowMapsHandler.delay = 1
+        with self.settings(GEOCODE_URL=self.geocode_url, GEOCODE_TIMEOUT=0.2):
+            self.assertIsNone(maps.geocode('Kilimani'))
+
+    @override_settings(NEARBY_LOOKUP_TIMEOUT=0.5)
+    def test_nearby_services_run_concurrently(self):
+        def slow_lookup(coordinates, place_type):
+            time.sleep(0.3)
+            return {'results': [place_type]}
+
+        started = time.monotonic()
+        with mock.patch.object(maps, 'places_nearby', slow_lookup):
+            services = maps.nearby_services({'lat': -1.28, 'lng': 36.82})
+        self.assertLess(time.monotonic() - started, 0.55)
+        self.assertEqual(services['police'], {'results': ['police']})
+        self.assertEqual(services['hospital'], {'results': ['hospital']})
+
+    @override_settings(NEARBY_LOOKUP_TIMEOUT=0.2)
+    def test_slow_or_failing_lookups_degrade_to_empty_results(self):
+        def lookup(coordinates, place_type):
+            if place_type == 'police':
+                raise ValueError('quota exceeded')
+            time.sleep(1)
+            return {'results': [place_type]}
+
+        with mock.patch.object(maps, 'places_nearby', lookup):
+            services = maps.nearby_services({'lat': -1.29, 'lng': 36.83})
+        self.assertEqual(services, {'police': {'results': []}, 'hospital': {'results': []}})
+
+    def test_failed_lookups_are_not_retried_on_every_request(self):
+        maps.get_nearby_cache().clear()
+        self.addCleanup(maps.get_nearby_cache().clear)
+        with mock.patch.object(maps, 'places_nearby', side_effect=ValueError('quota exceeded')) as lookup:
+            for _ in range(3):
+                services = maps.nearby_services({'lat': -1.27, 'lng': 36.8})
+        self.assertEqual(services, {'police': {'results': []}, 'hospital': {'results': []}})
+        self.assertEqual(lookup.call_count, 2)
+
+
+class LocationGeocodeTestClass(TestCase):
+    """
+    Test class that tests locations are geocoded when created or renamed and nowhere else
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def create_location(self, coordinates):
+        with mock.patch.object(maps, 'geocode', return_value=coordinates):
+            return Location.objects.create(loc_name='Kilimani')
+
+    def test_unchanged_name_is_not_geocoded_again(self):
+        location = Location.objects.get(id=self.create_location({'lat': -1.28, 'lng': 36.82}).id)
+        with mock.patch.object(maps, 'geocode') as geocode:
+            location.save()
+        geocode.assert_not_called()
+
+    def test_renamed_location_is_geocoded_again(self):
+        location = Location.objects.get(id=self.create_location({'lat': -1.28, 'lng': 36.82}).id)
+        location.loc_name = 'Karen'
+        with mock.patch.object(maps, 'geocode', return_value={'lat': -1.31, 'lng': 36.71}) as geocode:
+            location.save()
+        geocode.assert_called_once_with('Karen')
+        self.assertEqual(Location.objects.get(id=location.id).coordinates, {'lat': -1.31, 'lng': 36.71})
+
+    def test_failed_geocode_is_not_retried_by_views(self):
+        hood, profile = create_hood('Kilimani', 'sarah')
+        Location.objects.filter(id=hood.hood_location_id).update(loc_lat=None, loc_lng=None,
+                                                                  loc_geocoded_at=timezone.now())
+        with mock.patch.object(maps, 'geocode') as geocode:
+            for _ in range(3):
+                request = self.factory.get('/')
+                request.user = profile.profile_owner
+                self.assertEqual(HoodProfileMiddleware(views.index)(request).status_code, 200)
+        geocode.assert_not_called()
+
+    def test_failed_geocode_is_retried_after_a_while(self):
+        location = self.create_location(None)
+        self.assertIsNone(location.coordinates)
+        self.assertIsNotNone(location.loc_geocoded_at)
+
+        with mock.patch.object(maps, 'geocode', return_value={'lat': -1.28, 'lng': 36.82}) as geocode:
+            self.assertEqual(Location.geocode_pending(), (0, 0))
+            geocode.assert_not_called()
+            self.assertEqual(Location.geocode_pending(retry_after=0), (1, 1))
+        location = Location.objects.get(id=location.id)
+        self.assertEqual(location.coordinates, {'lat': -1.28, 'lng': 36.82})
+        self.assertEqual(location.loc_geohash, geohash_encode(-1.28, 36.82))
+
+
+class NewsFeedTestClass(TestCase):
+    """
+    Test class that tests keyset pagination of a hood's news
+    """
+    def setUp(self):
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.other_hood, other_profile = create_hood('Karen', 'marion')
+        for number in range(5):
+            News.objects.create(news_details='news {}'.format(number), news_created_by=self.profile,
+                                news_hood=self.hood)
+        News.objects.create(news_details='elsewhere', news_created_by=other_profile, news_hood=self.other_hood)
+
+    def test_pages_cover_the_hood_feed_once_in_order(self):
+        first_page, cursor = News.hood_feed(self.hood.id, limit=2)
+        second_page, cursor = News.hood_feed(self.hood.id, cursor, limit=2)
+        last_page, cursor = News.hood_feed(self.hood.id, cursor, limit=2)
+        details = [news.news_details for news in first_page + second_page + last_page]
+
+        self.assertEqual(details, ['news 4', 'news 3', 'news 2', 'news 1', 'news 0'])
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            News.hood_feed(self.hood.id, 'not-a-cursor')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'query plans are asserted against postgresql')
+class QueryPlanTestClass(TestCase):
+    """
+    Test class that seeds a large dataset and checks hot lookups are answered from indexes
+    """
+    locations = 500
+    hoods = 5000
+    news = 50000
+    businesses = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='planner', password='hood-pass-123')
+        profile = user.profile
+        Location.objects.bulk_create(
+            Location(loc_name='Location {}'.format(number), loc_lat=-1.28, loc_lng=36.82)
+            for number in range(cls.locations))
+        location_ids = list(Location.objects.values_list('id', flat=True))
+        Hood.objects.bulk_create(
+            Hood(hood_name='Hood {}'.format(number), hood_location_id=location_ids[number % cls.locations],
+                 hood_admin=profile)
+            for number in range(cls.hoods))
+        hood_ids = list(Hood.objects.values_list('id', flat=True))
+        News.objects.bulk_create(
+            News(news_details='news {}'.format(number), news_created_by=profile,
+                 news_hood_id=hood_ids[number % cls.hoods])
+            for number in range(cls.news))
+        categories = [choice[0] for choice in Business.BUSINESS_CHOICES]
+        Business.objects.bulk_create(
+            Business(business_name='Business {}'.format(number), business_owner=profile,
+                     business_category=categories[number % len(categories)],
+                     business_hood_id=hood_ids[number % cls.hoods], business_email='shop@hood.com')
+            for number in range(cls.businesses))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.hood = Hood.objects.get(hood_name='Hood 42')
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertNoSeqScan(self, queryset, table):
+        plan = self.explain(queryset)
+        self.assertNotIn('Seq Scan on {}'.format(table), plan, plan)
+
+    def test_news_feed_uses_index(self):
+        news = News.objects.filter(news_hood=self.hood).order_by('-news_pub_date', '-id')[:21]
+        self.assertNoSeqScan(news, 'hood_news')
+
+    def test_business_category_filter_uses_index(self):
+        businesses = Business.objects.filter(business_hood=self.hood, business_category='K')
+        self.assertNoSeqScan(businesses, 'hood_business')
+
+    def test_hood_name_iexact_uses_index(self):
+        self.assertNoSeqScan(Hood.objects.filter(hood_name__iexact='hood 42'), 'hood_hood')
+
+    def test_hoods_by_location_use_index(self):
+        self.assertNoSeqScan(Hood.objects.filter(hood_location=self.hood.hood_location_id), 'hood_hood')
+
+
+class QueryCountTestClass(TestCase):
+    """
+    Test class that pins the number of queries each view runs regardless of how many rows it shows
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.rows = 0
+
+    def add_news(self, count):
+        for number in range(count):
+            user = User.objects.create_user(username='writer{}'.format(self.rows + number))
+            News.objects.create(news_details='news', news_created_by=user.profile, news_hood=self.hood)
+        self.rows += count
+
+    def add_businesses(self, count):
+        for number in range(count):
+            user = User.objects.create_user(username='owner{}'.format(self.rows + number))
+            Business.objects.create(business_name='shop', business_category='K', business_owner=user.profile,
+                                    business_hood=self.hood, business_email='shop@hood.com')
+            Business.objects.create(business_name='shop', business_category='K', business_owner=self.profile,
+                                    business_hood=self.hood, business_email='shop@hood.com')
+        self.rows += count
+
+    def count_queries(self, view):
+        cache.clear()
+        request = self.factory.get('/')
+        request.user = self.profile.profile_owner
+        with CaptureQueriesContext(connection) as queries:
+            response = HoodProfileMiddleware(view)(request)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, view, add_rows, batches=(1, 10)):
+        """
+        helper that fails when the number of queries a view runs grows with the rows it renders
+        """
+        counts = []
+        for rows in batches:
+            add_rows(rows)
+            counts.append(self.count_queries(view))
+        self.assertEqual(len(set(counts)), 1, 'query counts grew with rows: {}'.format(counts))
+        return counts[0]
+
+    @mock.patch.object(maps, 'nearby_services', return_value={'police': {'results': []},
+                                                               'hospital': {'results': []}})
+    def test_index(self, nearby_services):
+        self.assertConstantQueries(views.index, self.add_news)
+
+    def test_news_feed(self):
+        self.assertConstantQueries(views.news_feed, self.add_news)
+
+    def test_all_business(self):
+        self.assertConstantQueries(views.all_business, self.add_businesses)
+
+    def test_manage_business(self):
+        self.assertConstantQueries(views.manage_business, self.add_businesses)
+
+
+class HoodProfileMiddlewareTestClass(TestCase):
+    """
+    Test class that tests the request profile is loaded once with its hood and location
+    """
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+
+    def test_profile_hood_and_location_load_in_one_query(self):
+        request = self.factory.get('/')
+        request.user = self.profile.profile_owner
+        HoodProfileMiddleware(lambda request: None)(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.profile.profile_hood.hood_location.loc_name, 'Kilimani Location')
+            self.assertEqual(str(request.profile), 'sarah')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+class OutgoingEmailTestClass(TestCase):
+    """
+    Test class that tests queued emails are delivered, retried and dead-lettered
+    """
+    def setUp(self):
+        self.email = OutgoingEmail.queue('Activate', 'Welcome to the hood', 'sarah@hood.com')
+
+    def test_queued_email_is_delivered(self):
+        self.assertEqual(deliver_queued_emails(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['sarah@hood.com'])
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.email_status, OutgoingEmail.SENT)
+        self.assertEqual(deliver_queued_emails(), (0, 0))
+
+    def test_failed_email_is_retried_later_then_dead_lettered(self):
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('smtp down')):
+            self.assertEqual(deliver_queued_emails(), (0, 1))
+            self.email.refresh_from_db()
+            self.assertEqual(self.email.email_status, OutgoingEmail.PENDING)
+            self.assertGreater(self.email.email_next_attempt, self.email.email_created)
+            self.assertEqual(deliver_queued_emails(), (0, 0))
+
+            OutgoingEmail.objects.update(email_next_attempt=self.email.email_created)
+            self.assertEqual(deliver_queued_emails(), (0, 1))
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.email_status, OutgoingEmail.DEAD)
+        self.assertEqual(self.email.email_last_error, 'smtp down')
+
+
+@override_settings(IMAGE_MAX_DIMENSION=400, IMAGE_RENDITION_WIDTHS=(100, 200))
+class ImagePipelineTestClass(SimpleTestCase):
+    """
+    Test class that tests uploaded images are capped, stripped of exif data and given renditions
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.media_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def upload(self, name, image_format, mode='RGB'):
+        image = Image.new(mode, (1000, 500))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        output = BytesIO()
+        image.save(output, image_format, exif=exif.tobytes())
+        return self.storage.save(name, ContentFile(output.getvalue()))
+
+    def open(self, name):
+        with self.storage.open(name) as stored:
+            image = Image.open(stored)
+            image.load()
+        return image
+
+    def test_upload_is_capped_rotated_and_stripped(self):
+        name = process_image(self.storage, self.upload('footages/street.jpg', 'JPEG'))
+        image = self.open(name)
+
+        self.assertRegex(name, r'^footages/street_\w+\.jpg$')
+        self.assertEqual(image.size, (200, 400))
+        self.assertNotIn(0x0112, image.getexif())
+
+    def test_renditions_are_written_as_jpeg_and_webp(self):
+        name = process_image(self.storage, self.upload('footages/street.jpg', 'JPEG'))
+
+        self.assertEqual(self.open(rendition_name(name, 100, 'jpg')).size, (100, 200))
+        self.assertEqual(self.open(rendition_name(name, 200, 'webp')).format, 'WEBP')
+
+    def test_unsupported_formats_are_converted_to_jpeg(self):
+        name = process_image(self.storage, self.upload('profiles/me.tiff', 'TIFF', mode='RGBA'))
+
+        self.assertEqual(name, 'profiles/me.jpg')
+        self.assertEqual(self.open(name).format, 'JPEG')
+
+    def test_failure_keeps_the_upload_and_removes_partial_files(self):
+        upload = self.upload('footages/street.jpg', 'JPEG')
+        with mock.patch('hood.images.encode', side_effect=[b'copy', b'rendition', OSError('disk full')]):
+            with self.assertRaises(OSError):
+                process_image(self.storage, upload)
+        self.assertEqual(self.storage.listdir('footages'), ([], ['street.jpg']))
+        self.assertEqual(self.open(upload).size, (1000, 500))
+
+
+class ImageJobTestClass(TestCase):
+    """
+    Test class that tests uploads are processed by the image worker after the request
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media = self.settings(MEDIA_ROOT=self.media_root, IMAGE_RENDITION_WIDTHS=(100,))
+        self.media.enable()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        output = BytesIO()
+        Image.new('RGB', (300, 300)).save(output, 'PNG')
+        self.news = News(news_details='news', news_created_by=self.profile, news_hood=self.hood)
+        self.news.news_footage.save('street.png', ContentFile(output.getvalue()))
+        self.job = ImageJob.queue(self.news, 'news_footage')
+
+    def tearDown(self):
+        self.media.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_footage_has_no_renditions_until_processed(self):
+        self.assertEqual(rendition_urls(self.news.news_footage), {})
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(run_image_jobs(executor, 10), (1, 0))
+
+        news = News.objects.get(id=self.news.id)
+        self.assertTrue(news.news_footage_ready)
+        self.assertEqual(list(rendition_urls(news.news_footage)), [100])
+        self.assertEqual(ImageJob.objects.get(id=self.job.id).job_status, ImageJob.DONE)
+        # the upload is only deleted once the news points at its processed copy
+        self.assertTrue(news.news_footage.storage.exists(news.news_footage.name))
+        self.assertFalse(news.news_footage.storage.exists(self.job.job_image))
+
+    def test_replaced_image_discards_the_processed_copy(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with mock.patch.object(ImageJob, 'mark_done', return_value=False):
+                self.assertEqual(run_image_jobs(executor, 10), (1, 0))
+        self.assertEqual(sorted(os.listdir(self.media_root + '/footages')), [os.path.basename(self.job.job_image)])
+
+    def test_failed_job_is_retried(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with mock.patch('hood.images.process_image', side_effect=OSError('truncated image')):
+                self.assertEqual(run_image_jobs(executor, 10), (0, 1))
+            self.assertEqual(ImageJob.objects.get(id=self.job.id).job_status, ImageJob.PENDING)
+            self.assertEqual(run_image_jobs(executor, 10), (1, 0))
+
+
+class HoodFeedCacheTestClass(TransactionTestCase):
+    """
+    Test class that tests a hood's rendered feed is shared until its news changes
+    """
+    def setUp(self):
+        cache.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.other_hood, self.other_profile = create_hood('Karen', 'marion')
+
+    def post(self, hood, profile, details):
+        return News.objects.create(news_details=details, news_created_by=profile, news_hood=hood)
+
+    def test_feed_is_rendered_once_per_version(self):
+        self.post(self.hood, self.profile, 'water is back')
+        self.assertIn('water is back', views.render_hood_feed(self.hood.id))
+        with self.assertNumQueries(0):
+            self.assertIn('water is back', views.render_hood_feed(self.hood.id))
+
+    def test_new_and_deleted_news_expire_only_their_hood(self):
+        views.render_hood_feed(self.hood.id)
+        views.render_hood_feed(self.other_hood.id)
+
+        news = self.post(self.hood, self.profile, 'road closed')
+        self.assertIn('road closed', views.render_hood_feed(self.hood.id))
+        with self.assertNumQueries(0):
+            views.render_hood_feed(self.other_hood.id)
+
+        news.delete()
+        self.assertNotIn('road closed', views.render_hood_feed(self.hood.id))
+
+
+class SharedCacheTestClass(TestCase):
+    """
+    Test class that tests deployments are warned about caches other processes can't see
+    """
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_memcached_passes_the_check(self):
+        self.assertIsNone(shared_cache_warning())
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'hood_cache'}})
+    def test_database_cache_is_flagged(self):
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['hood.W001'])
+
+    @override_settings(CACHES=MEMORY_CACHE)
+    def test_commands_warn_about_process_local_caches(self):
+        stderr = StringIO()
+        call_command('geocode_locations', stdout=StringIO(), stderr=stderr)
+        self.assertIn('LocMemCache cache backend is not shared', stderr.getvalue())
+
+
+class HoodDirectoryTestClass(TransactionTestCase):
+    """
+    Test class that tests the cached location to hoods map behind the select hood dropdown
+    """
+    def setUp(self):
+        cache.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.client.force_login(self.profile.profile_owner)
+
+    def test_directory_lists_hoods_by_location(self):
+        response = self.client.get(reverse('hood_directory'))
+        self.assertEqual(json.loads(response.content.decode()), {'locations': [
+            {'id': self.hood.hood_location_id, 'name': 'Kilimani Location',
+             'hoods': [{'id': self.hood.id, 'name': 'Kilimani'}]}]})
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_unchanged_directory_is_not_modified(self):
+        etag = self.client.get(reverse('hood_directory'))['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('hood_directory'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'hood_hood' in query['sql']])
+
+    def test_directory_is_built_once_per_request(self):
+        with mock.patch.object(Hood, 'directory', wraps=Hood.directory) as directory:
+            first = self.client.get(reverse('hood_directory'))
+            second = self.client.get(reverse('hood_directory'))
+        self.assertEqual(directory.call_count, 1)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(first['Last-Modified'], second['Last-Modified'])
+
+    def test_hood_dropdown_is_served_from_the_directory(self):
+        self.client.get(reverse('hood_directory'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(views.load_hood), {'hood_location': self.hood.hood_location_id},
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertContains(response, 'Kilimani')
+        self.assertFalse([query for query in queries if 'hood_hood' in query['sql']])
+
+    def test_new_hood_changes_the_directory(self):
+        etag = self.client.get(reverse('hood_directory'))['ETag']
+        create_hood('Karen', 'marion')
+        response = self.client.get(reverse('hood_directory'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content.decode())['locations']), 2)
+
+
+class ConditionalPageTestClass(TransactionTestCase):
+    """
+    Test class that tests unchanged pages answer 304 without being rendered
+    """
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+
+    def get(self, view, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        request = self.factory.get('/', **headers)
+        request.user = self.profile.profile_owner
+        return HoodProfileMiddleware(view)(request)
+
+    def add_business(self):
+        return Business.objects.create(business_name='shop', business_category='K', business_owner=self.profile,
+                                       business_hood=self.hood, business_email='shop@hood.com')
+
+    @mock.patch.object(maps, 'nearby_services', return_value={'police': {'results': []},
+                                                               'hospital': {'results': []}})
+    def test_unchanged_index_is_not_rendered(self, nearby_services):
+        etag = self.get(views.index)['ETag']
+        response = self.get(views.index, etag)
+        self.assertEqual(response.status_code, 304)
+        nearby_services.assert_not_called()
+
+        News.objects.create(news_details='news', news_created_by=self.profile, news_hood=self.hood)
+        self.assertEqual(self.get(views.index, etag).status_code, 200)
+
+    @override_settings(SERVICE_POINTS_LIVE_FALLBACK=True)
+    @mock.patch.object(maps, 'nearby_services', return_value={'police': {'results': []},
+                                                               'hospital': {'results': []}})
+    def test_index_changes_when_live_services_are_refreshed(self, nearby_services):
+        nearby = maps.get_nearby_cache()
+        self.addCleanup(nearby.clear)
+        key = maps.nearby_cache_key(self.hood.hood_location.coordinates, 'police')
+        nearby.set(key, {'results': [{'name': 'Kilimani Police'}]})
+        etag = self.get(views.index)['ETag']
+        self.assertEqual(self.get(views.index, etag).status_code, 304)
+
+        nearby.set(key, {'results': [{'name': 'Kilimani Police Post'}]})
+        self.assertEqual(self.get(views.index, etag).status_code, 200)
+
+    def test_business_pages_change_with_their_businesses(self):
+        for view in (views.all_business, views.manage_business):
+            etag = self.get(view)['ETag']
+            self.assertEqual(self.get(view, etag).status_code, 304)
+            business = self.add_business()
+            self.assertEqual(self.get(view, etag).status_code, 200)
+            business.delete()
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'search columns are maintained by postgresql triggers')
+class SearchTestClass(TestCase):
+    """
+    Test class that tests ranked full text search within a hood
+    """
+    def setUp(self):
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.other_hood, other_profile = create_hood('Karen', 'marion')
+        News.objects.create(news_details='Water rationing starts on Monday', news_created_by=self.profile,
+                            news_hood=self.hood)
+        News.objects.create(news_details='Lost dog near the water tower, the dog answers to Simba',
+                            news_created_by=self.profile, news_hood=self.hood)
+        News.objects.create(news_details='Dog show this weekend', news_created_by=other_profile,
+                            news_hood=self.other_hood)
+        Business.objects.create(business_name='Mama Mboga Kiosk', business_category='K', business_owner=self.profile,
+                                business_hood=self.hood, business_email='kiosk@hood.com',
+                                business_description='Fresh vegetables daily')
+
+    def test_news_search_is_ranked_and_scoped_to_the_hood(self):
+        results = list(News.search(self.hood.id, 'dogs'))
+        self.assertEqual([news.news_details[:8] for news in results], ['Lost dog'])
+
+    def test_updated_news_is_searchable(self):
+        news = News.objects.get(news_details__startswith='Water')
+        news.news_details = 'Power outage on Monday'
+        news.save()
+        self.assertEqual(list(News.search(self.hood.id, 'outage')), [news])
+        self.assertEqual(list(News.search(self.hood.id, 'rationing')), [])
+
+    def test_business_search_covers_name_and_description(self):
+        self.assertEqual(News.search(self.hood.id, 'kiosk').count(), 0)
+        self.assertEqual(Business.search(self.hood.id, 'kiosk').count(), 1)
+        self.assertEqual(Business.search(self.hood.id, 'vegetable').count(), 1)
+
+
+@override_settings(BUSINESS_PAGE_SIZE=2)
+class BusinessDirectoryTestClass(TestCase):
+    """
+    Test class that tests filtering and paging the hood's business directory
+    """
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        for name, category in (('Kiosk A', 'K'), ('Kiosk B', 'K'), ('Kiosk C', 'K'), ('Salon', 'S')):
+            Business.objects.create(business_name=name, business_category=category, business_owner=self.profile,
+                                    business_hood=self.hood, business_email='shop@hood.com')
+
+    def get(self, **params):
+        request = self.factory.get('/', params)
+        request.user = self.profile.profile_owner
+        with mock.patch.object(views, 'render', return_value=HttpResponse()) as render:
+            HoodProfileMiddleware(views.all_business)(request)
+        return render.call_args[0][2]
+
+    def test_category_counts(self):
+        counts = {facet['category']: facet['count'] for facet in Business.category_counts(self.hood.id)}
+        self.assertEqual(counts['K'], 3)
+        self.assertEqual(counts['S'], 1)
+        self.assertEqual(counts['B'], 0)
+
+    def test_filtered_pages(self):
+        context = self.get(category='K', page=2)
+        self.assertEqual([business.business_name for business in context['businesses']], ['Kiosk C'])
+        self.assertEqual(context['total'], 3)
+        self.assertEqual(context['businesses'].paginator.num_pages, 2)
+
+    def test_unknown_category_lists_everything(self):
+        context = self.get(category='XX')
+        self.assertIsNone(context['category'])
+        self.assertEqual(context['total'], 4)
+
+
+class DirectoryImportTestClass(TestCase):
+    """
+    Test class that tests bulk importing and exporting locations, hoods and businesses
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.admin = User.objects.create_user(username='sarah')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = '{}/{}'.format(self.directory, name)
+        with open(path, 'w') as upload:
+            upload.write(content)
+        return path
+
+    def test_jsonl_import_resolves_names_across_chunks(self):
+        records = [
+            {'type': 'location', 'name': 'Kilimani', 'lat': -1.29, 'lng': 36.78},
+            {'type': 'hood', 'name': 'Kilimani Estate', 'location': 'Kilimani', 'admin': 'sarah'},
+            {'type': 'business', 'name': 'Kiosk', 'category': 'K', 'hood': 'Kilimani Estate',
+             'owner': 'sarah', 'email': 'kiosk@hood.com'},
+            {'type': 'business', 'name': 'Ghost', 'category': 'K', 'hood': 'Nowhere', 'owner': 'sarah',
+             'email': 'ghost@hood.com'},
+            {'type': 'location', 'name': 'Kilimani'},
+        ]
+        path = self.write('directory.jsonl', '\n'.join(json.dumps(record) for record in records))
+        output, errors = StringIO(), StringIO()
+        call_command('import_directory', path, chunk_size=2, stdout=output, stderr=errors)
+
+        self.assertIn('Created 1 locations, 1 hoods and 1 businesses', output.getvalue())
+        self.assertIn("Line 4: hood 'Nowhere' does not exist", errors.getvalue())
+        business = Business.objects.get(business_name='Kiosk')
+        self.assertEqual(business.business_hood.hood_location.loc_lat, -1.29)
+        self.assertEqual(business.business_hood.stats.stats_businesses, 1)
+
+    def test_csv_export_round_trip(self):
+        path = self.write('locations.csv', 'name,lat,lng\nKaren,-1.32,36.7\nRuaka,,\n')
+        call_command('import_directory', path, type='location', stdout=StringIO(), stderr=StringIO())
+
+        output = StringIO()
+        call_command('export_directory', format='csv', type=['location'], stdout=output)
+        self.assertEqual(output.getvalue().splitlines(), ['name,lat,lng', 'Karen,-1.32,36.7', 'Ruaka,,'])
+
+
+class NewsExportTestClass(TestCase):
+    """
+    Test class that tests hood admins can stream their hood's news history
+    """
+    def setUp(self):
+        cache.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        for day, details in ((1, 'old news'), (15, 'news, with a comma')):
+            news = News.objects.create(news_details=details, news_created_by=self.profile, news_hood=self.hood)
+            News.objects.filter(id=news.id).update(
+                news_pub_date=timezone.make_aware(timezone.datetime(2018, 6, day, 12)))
+        self.client.force_login(self.profile.profile_owner)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_news'), params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_export_within_dates(self):
+        response, content = self.export(**{'from': '2018-06-10', 'to': '2018-06-15'})
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual([row['details'] for row in rows], ['news, with a comma'])
+        self.assertEqual(rows[0]['created_by'], 'sarah')
+
+    def test_json_export_with_footage(self):
+        response, content = self.export(format='json', footage='1')
+        news = json.loads(content)
+        self.assertEqual([item['details'] for item in news], ['old news', 'news, with a comma'])
+        self.assertEqual(news[0]['footage'], '')
+
+    def test_only_the_hood_admin_can_export(self):
+        member = User.objects.create_user(username='marion')
+        self.client.force_login(member)
+        Profile.objects.filter(profile_owner=member).update(profile_hood=self.hood, profile_id='12345678')
+        self.assertEqual(self.client.get(reverse('export_news')).status_code, 403)
+
+
+class GridIndexTestClass(SimpleTestCase):
+    """
+    Test class that tests k nearest lookups against a brute force search
+    """
+    def test_nearest_matches_brute_force(self):
+        import random
+        generator = random.Random(7)
+        points = [(generator.uniform(-1.5, -1.0), generator.uniform(36.6, 37.1)) for _ in range(500)]
+        index = GridIndex(cell_size=0.02)
+        for number, (lat, lng) in enumerate(points):
+            index.add(number, lat, lng)
+
+        for lat, lng in ((-1.28, 36.82), (-1.6, 36.5), (-1.0, 37.3)):
+            expected = sorted(range(len(points)), key=lambda number: distance_km(lat, lng, *points[number]))[:5]
+            self.assertEqual([item for _, item in index.nearest(lat, lng, 5)], expected)
+
+    def test_max_distance(self):
+        index = GridIndex()
+        index.add('nairobi', -1.28, 36.82)
+        index.add('mombasa', -4.04, 39.67)
+        self.assertEqual([item for _, item in index.nearest(-1.3, 36.8, 5, max_km=100)], ['nairobi'])
+
+    def test_geohash(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+
+class NearbyHoodsTestClass(TransactionTestCase):
+    """
+    Test class that tests hoods are found by distance and the index follows new hoods
+    """
+    def setUp(self):
+        cache.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+
+    def test_new_hoods_are_indexed(self):
+        self.assertEqual([hood['name'] for hood in Hood.nearby(-1.29, 36.8)], ['Kilimani'])
+        with mock.patch.object(maps, 'geocode', return_value={'lat': -1.31, 'lng': 36.81}):
+            location = Location.objects.create(loc_name='Lavington')
+        Hood.objects.create(hood_name='Lavington', hood_location=location, hood_admin=self.profile)
+
+        self.assertEqual([hood['name'] for hood in Hood.nearby(-1.31, 36.81)], ['Lavington', 'Kilimani'])
+        self.assertEqual(location.loc_geohash[:5], geohash_encode(-1.31, 36.81)[:5])
+
+
+class ServicePointTestClass(TransactionTestCase):
+    """
+    Test class that tests dashboards list the closest service points without calling the places api
+    """
+    def setUp(self):
+        cache.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+
+    def places(self, coordinates, place_type, open_now=True):
+        return {'results': [
+            {'place_id': place_type + '-near', 'name': 'Near ' + place_type, 'vicinity': 'Ngong Road',
+             'geometry': {'location': {'lat': coordinates['lat'] + 0.01, 'lng': coordinates['lng']}}},
+            {'place_id': place_type + '-far', 'name': 'Far ' + place_type,
+             'geometry': {'location': {'lat': coordinates['lat'] + 0.05, 'lng': coordinates['lng']}}},
+        ]}
+
+    def test_refresh_from_places(self):
+        with mock.patch.object(maps, 'places_nearby', side_effect=self.places) as places_nearby:
+            call_command('refresh_service_points', stdout=StringIO(), stderr=StringIO())
+            call_command('refresh_service_points', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(places_nearby.call_count, 4)
+        self.assertEqual(ServicePoint.objects.count(), 4)
+
+        coordinates = self.hood.hood_location.coordinates
+        with mock.patch.object(maps, 'nearby_services') as nearby_services:
+            found = services.nearby_services(coordinates)
+        nearby_services.assert_not_called()
+        self.assertEqual([place['name'] for place in found['police']['results']], ['Near police', 'Far police'])
+        self.assertEqual(found['hospital']['results'][0]['vicinity'], 'Ngong Road')
+
+    def test_csv_updates_existing_points(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = directory + '/services.csv'
+        refreshed = []
+        for vicinity in ('Ngong Road', 'Argwings Kodhek Road'):
+            with open(path, 'w', newline='') as stream:
+                stream.write('name,kind,lat,lng,vicinity\n')
+                stream.write('Kilimani Police,police,-1.29,36.79,{}\n'.format(vicinity))
+                stream.write('Clinic,clinic,-1.29,36.79,\n')
+            out, err = StringIO(), StringIO()
+            call_command('refresh_service_points', csv=path, stdout=out, stderr=err)
+            self.assertIn("unknown service kind 'clinic'", err.getvalue())
+            refreshed.append(ServicePoint.objects.get(service_name='Kilimani Police').service_refreshed)
+
+        self.assertIn('Created 0, updated 1 and deleted 0', out.getvalue())
+        self.assertGreater(refreshed[1], refreshed[0])
+        found = ServicePoint.nearest(self.hood.hood_location.coordinates, 'police')
+        self.assertEqual([place['vicinity'] for place in found], ['Argwings Kodhek Road'])
+
+    def test_full_refresh_deletes_points_places_no_longer_returns(self):
+        ServicePoint.objects.create(service_name='Closed police', service_kind='police', service_lat=-1.29,
+                                    service_lng=36.79, service_place_id='police-closed')
+        ServicePoint.objects.create(service_name='Kilimani Police', service_kind='police', service_lat=-1.29,
+                                    service_lng=36.79)
+        out = StringIO()
+        with mock.patch.object(maps, 'places_nearby', side_effect=self.places):
+            call_command('refresh_service_points', kind=['police'], stdout=out, stderr=StringIO())
+
+        self.assertIn('Created 2, updated 0 and deleted 1', out.getvalue())
+        found = ServicePoint.nearest(self.hood.hood_location.coordinates, 'police')
+        self.assertEqual(sorted(place['name'] for place in found), ['Far police', 'Kilimani Police', 'Near police'])
+
+    def test_only_uncovered_hoods_are_looked_up_between_full_refreshes(self):
+        with mock.patch.object(maps, 'places_nearby', side_effect=self.places):
+            call_command('refresh_service_points', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(services.uncovered_centres(), [])
+
+        with mock.patch.object(maps, 'geocode', return_value={'lat': 0.5, 'lng': 35.27}):
+            location = Location.objects.create(loc_name='Eldoret')
+        Hood.objects.create(hood_name='Eldoret', hood_location=location, hood_admin=self.profile)
+        self.assertEqual(services.uncovered_centres(), [{'lat': 0.5, 'lng': 35.27}])
+        # looked up once per SERVICE_POINTS_REFRESH_SECONDS even when places has nothing there
+        self.assertEqual(services.uncovered_centres(), [])
+
+    def test_refresh_in_another_process_reaches_built_indexes(self):
+        coordinates = self.hood.hood_location.coordinates
+        # this worker builds its index before the directory is filled
+        self.assertEqual(ServicePoint.nearest(coordinates, 'police'), [])
+
+        def refresh_elsewhere():
+            # another thread gets its own cache connection, like the process running the command
+            try:
+                with mock.patch.object(maps, 'places_nearby', side_effect=self.places):
+                    call_command('refresh_service_points', stdout=StringIO(), stderr=StringIO())
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=refresh_elsewhere)
+        worker.start()
+        worker.join()
+        self.assertEqual([place['name'] for place in ServicePoint.nearest(coordinates, 'police')],
+                         ['Near police', 'Far police'])
+
+    @override_settings(SERVICE_POINTS_LIVE_FALLBACK=True)
+    def test_live_fallback_for_missing_kinds(self):
+        ServicePoint.objects.create(service_name='Kilimani Police', service_kind='police',
+                                    service_lat=-1.29, service_lng=36.79)
+        live = {'hospital': {'results': [{'name': 'Live hospital'}]}}
+        with mock.patch.object(maps, 'nearby_services', return_value=live) as nearby_services:
+            found = services.nearby_services(self.hood.hood_location.coordinates)
+        nearby_services.assert_called_once_with(self.hood.hood_location.coordinates, ('hospital',))
+        self.assertEqual(found['police']['results'][0]['name'], 'Kilimani Police')
+        self.assertEqual(found['hospital'], live['hospital'])
+
+
+class NewsHubTestClass(TransactionTestCase):
+    """
+    Test class that tests new posts are streamed to the members of their hood
+    """
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.hub = hub.NewsHub()
+        asyncio.run_coroutine_threadsafe(self.hub.start('127.0.0.1', 0, '127.0.0.1', 0), self.loop).result(5)
+        self.connections = []
+
+    def tearDown(self):
+        for client in self.connections:
+            client.close()
+        self.loop.call_soon_threadsafe(self.hub.close)
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def connect(self, token, **headers):
+        client = HTTPConnection(*self.hub.address, timeout=5)
+        self.connections.append(client)
+        client.request('GET', '/news/stream/?token=' + token, headers=headers)
+        return client.getresponse()
+
+    def read_event(self, response):
+        lines = []
+        while True:
+            line = response.fp.readline().decode().rstrip('\n')
+            if not line:
+                return json.loads(lines[-1][len('data: '):])
+            if not line.startswith(':'):
+                lines.append(line)
+
+    def publish(self, hood_id, event):
+        self.loop.call_soon_threadsafe(self.hub.publish, hood_id, event)
+
+    def post(self, details):
+        request = self.factory.post('/post/', {'news_details': details})
+        request.user = self.profile.profile_owner
+        HoodProfileMiddleware(views.post)(request)
+
+    @unittest.skipIf(connection.vendor == 'postgresql', 'posts are notified through postgresql')
+    def test_post_is_streamed(self):
+        response = self.connect(hub.stream_token(self.hood.id))
+        self.assertEqual(response.getheader('Content-Type'), 'text/event-stream')
+
+        with override_settings(NEWS_HUB_PUBLISH_PORT=self.hub.publish_address[1]):
+            self.post('Water is back on')
+
+        event = self.read_event(response)
+        self.assertEqual(event['details'], 'Water is back on')
+        self.assertEqual(event['id'], News.objects.get().id)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'notifications need postgresql')
+    def test_post_is_notified_through_the_database(self):
+        import psycopg2
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.autocommit = True
+        self.loop.call_soon_threadsafe(self.hub.listen, listener)
+        response = self.connect(hub.stream_token(self.hood.id))
+
+        self.post('Water is back on')
+        self.assertEqual(self.read_event(response)['details'], 'Water is back on')
+
+    def test_events_only_reach_their_hood(self):
+        other_hood, _ = create_hood('Karen', 'marion')
+        response = self.connect(hub.stream_token(self.hood.id))
+        self.publish(other_hood.id, {'id': 1, 'details': 'Karen news'})
+        self.publish(self.hood.id, {'id': 2, 'details': 'Kilimani news'})
+        self.assertEqual(self.read_event(response)['details'], 'Kilimani news')
+
+        self.assertEqual(self.connect('forged-token').status, 403)
+
+    def test_reconnect_replays_missed_events(self):
+        for news_id in (1, 2, 3):
+            self.publish(self.hood.id, {'id': news_id})
+        response = self.connect(hub.stream_token(self.hood.id), **{'Last-Event-ID': '1'})
+        self.assertEqual([self.read_event(response)['id'] for _ in range(2)], [2, 3])
+
+
+class HoodStatsTestClass(TestCase):
+    """
+    Test class that tests hood counters follow members, posts and businesses
+    """
+    def setUp(self):
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.other_hood, _ = create_hood('Karen', 'marion')
+
+    def stats(self, hood):
+        stats = HoodStats.objects.get(stats_hood=hood)
+        return stats.stats_members, stats.stats_posts, stats.stats_businesses
+
+    def test_counters_follow_signals(self):
+        self.profile.email_confirmed = True
+        self.profile.save()
+        News.objects.create(news_details='news', news_created_by=self.profile, news_hood=self.hood)
+        business = Business.objects.create(business_name='shop', business_category='K', business_owner=self.profile,
+                                           business_hood=self.hood, business_email='shop@hood.com')
+        self.assertEqual(self.stats(self.hood), (1, 1, 1))
+
+        business.delete()
+        Profile.update_profile_hood(self.profile.profile_owner_id, self.other_hood)
+        self.assertEqual(self.stats(self.hood), (0, 1, 0))
+        self.assertEqual(self.stats(self.other_hood), (1, 0, 0))
+
+        Profile.objects.get(id=self.profile.id).delete()
+        self.assertEqual(self.stats(self.other_hood), (0, 0, 0))
+
+    def test_reconcile_fixes_drift(self):
+        Profile.objects.filter(id=self.profile.id).update(email_confirmed=True)
+        News.objects.create(news_details='news', news_created_by=self.profile, news_hood=self.hood)
+        HoodStats.objects.update(stats_members=7, stats_posts=-2)
+
+        output = StringIO()
+        call_command('reconcile_hood_stats', stdout=output)
+        self.assertIn('Reconciled 2 hoods', output.getvalue())
+        self.assertEqual(self.stats(self.hood), (1, 1, 0))
+        self.assertEqual(self.stats(self.other_hood), (0, 0, 0))
+
+
+class UserProfileSyncTestClass(TestCase):
+    """
+    Test class that tests user saves only write the profile when it changed
+    """
+    def setUp(self):
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+
+    def profile_queries(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return [query['sql'] for query in queries if 'hood_profile' in query['sql']]
+
+    def test_unchanged_profile_is_not_written(self):
+        user = User.objects.get(username='sarah')
+        self.assertEqual(self.profile_queries(lambda: self.client.force_login(user)), [])
+        user.profile
+        self.assertEqual(self.profile_queries(user.save), [])
+
+    def test_changed_fields_are_written(self):
+        user = self.profile.profile_owner
+        user.profile.email_confirmed = True
+        queries = self.profile_queries(user.save)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('email_confirmed', queries[0])
+        self.assertNotIn('profile_hood', queries[0])
+        self.assertTrue(Profile.objects.get(id=self.profile.id).email_confirmed)
+        self.assertEqual(HoodStats.objects.get(stats_hood=self.hood).stats_members, 1)
+
+
+class MemberProvisioningTestClass(TestCase):
+    """
+    Test class that tests bulk provisioning the members of a hood
+    """
+    def setUp(self):
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_csv_provisioning(self):
+        path = self.directory + '/members.csv'
+        with open(path, 'w', newline='') as upload:
+            upload.write('username,email,profile_id,hood\n'
+                         'marion,marion@hood.com,23456789,Kilimani\n'
+                         'wanjiku,wanjiku@hood.com,,Kilimani\n'
+                         'sarah,sarah@hood.com,12345678,Kilimani\n'
+                         'kamau,kamau@hood.com,12a,Kilimani\n'
+                         'otieno,otieno@hood.com,34567890,Karen\n')
+        output, errors = StringIO(), StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('provision_members', path, stdout=output, stderr=errors)
+
+        self.assertIn('Created 2 members', output.getvalue())
+        self.assertIn("Line 4: username 'sarah' is taken", errors.getvalue())
+        self.assertIn('Line 5: ID number must have eight numeric characters', errors.getvalue())
+        self.assertIn("Line 6: hood 'Karen' does not exist", errors.getvalue())
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in queries))
+
+        member = Profile.objects.select_related('profile_owner').get(profile_owner__username='marion')
+        self.assertEqual((member.profile_hood_id, member.profile_id), (self.hood.id, '23456789'))
+        self.assertFalse(member.profile_owner.has_usable_password())
+        self.assertEqual(HoodStats.objects.get(stats_hood=self.hood).stats_members, 2)
+
+
+class CachedAuthTestClass(TransactionTestCase):
+    """
+    Test class that tests sessions, users and profiles are served from the cache until they change
+    """
+    def setUp(self):
+        cache.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.client.force_login(self.profile.profile_owner)
+
+    def test_repeat_requests_run_no_auth_queries(self):
+        self.assertEqual(self.client.get(reverse('news_feed')).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('news_feed')).status_code, 200)
+        # the feed page itself is the only query
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('SELECT "hood_news"'))
+
+    def test_cached_profile_follows_changes(self):
+        user_id = self.profile.profile_owner_id
+        self.assertEqual(Profile.find_cached_profile(user_id).profile_hood.hood_name, 'Kilimani')
+
+        self.hood.hood_name = 'Kilimani Estate'
+        self.hood.save()
+        self.assertEqual(Profile.find_cached_profile(user_id).profile_hood.hood_name, 'Kilimani Estate')
+
+        other_hood, _ = create_hood('Karen', 'marion')
+        Profile.update_profile_hood(user_id, other_hood)
+        self.assertEqual(Profile.find_cached_profile(user_id).profile_hood_id, other_hood.id)
+
+    def test_sessions_from_before_the_cached_backend_stay_logged_in(self):
+        client = self.client_class()
+        client.force_login(self.profile.profile_owner, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(client.get(reverse('news_feed')).status_code, 200)
+
+    def test_sessions_survive_a_cache_flush(self):
+        self.client.get(reverse('news_feed'))
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('news_feed')).status_code, 200)
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class MetricsTestClass(TestCase):
+    """
+    Test class that tests requests are measured by url name and exposed to prometheus
+    """
+    def setUp(self):
+        cache.clear()
+        for histogram in metrics.METRICS:
+            histogram.clear()
+        self.hood, self.profile = create_hood('Kilimani', 'sarah')
+        self.client.force_login(self.profile.profile_owner)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_views_queries_and_templates_are_measured(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('news_feed'))
+        scraped = self.scrape()
+
+        self.assertIn('hood_request_duration_seconds_count{view="news_feed",method="GET",status="200"} 1', scraped)
+        self.assertIn('hood_request_queries_bucket{view="news_feed",le="+Inf"} 1', scraped)
+        self.assertIn('hood_template_render_seconds_count{template="index.html"} 1', scraped)
+        self.assertIn('hood_template_render_seconds_count{template="hood/news-feed.html"} 1', scraped)
+
+    def test_external_calls_are_measured(self):
+        response = mock.Mock(**{'json.return_value': {'results': []}})
+        with mock.patch.object(maps.requests, 'get', return_value=response):
+            maps.geocode('Kilimani')
+        self.assertIn('hood_external_call_seconds_count{service="geocode"} 1', self.scrape())
+
+    def test_scrapes_add_up_every_workers_metrics(self):
+        metrics.EXTERNAL_SECONDS.observe(0.3, service='places')
+        metrics.flush_metrics()
+        # another worker flushing the same series
+        MetricSample.add('hood_external_call_seconds', json.dumps(['places']), 'count', 2)
+        metrics.EXTERNAL_SECONDS.observe(0.3, service='places')
+
+        scraped = self.scrape()
+        self.assertIn('hood_external_call_seconds_count{service="places"} 4', scraped)
+        self.assertIn('hood_external_call_seconds_bucket{service="places",le="0.5"} 2', scraped)
+        self.assertIn('hood_external_call_seconds_sum{service="places"} 0.6', scraped)
+
+    def test_metrics_need_the_token_or_staff(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.assertLogs('hood.metrics', 'WARNING') as logs:
+            self.client.get(reverse('news_feed'))
+        self.assertIn('(news_feed)', logs.output[0])
+        self.assertIn('SELECT "hood_news"', logs.output[0])
+
+
+class BenchmarkTestClass(TransactionTestCase):
+    """
+    Test class that tests the benchmark seeds its hoods and drives every flow against the stub maps server
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_benchmark_report(self):
+        with bench.StubMapsServer(latency=0) as server, bench.stub_maps(server):
+            members = bench.seed(hoods=2, members=2, news=3, businesses=2, service_points=4)
+            self.assertEqual(bench.seed(hoods=2, members=2, news=3, businesses=2, service_points=4), members)
+            report = bench.Benchmark(members, concurrency=1, iterations=2).run()
+
+        self.assertEqual(Location.objects.get(loc_name='bench-location-0').coordinates,
+                         dict(zip(('lat', 'lng'), bench.stub_point('bench-location-0'))))
+        self.assertEqual(report['total']['errors'], 0, report['total']['error_samples'])
+        self.assertEqual(list(report['flows']), list(bench.FLOWS))
+        for summary in report['flows'].values():
+            self.assertEqual(summary['requests'], 2)
+            self.assertGreater(summary['queries_per_request']['max'], 0)
+        json.dumps(report)
+
+    def test_seed_with_other_volumes_reseeds(self):
+        with bench.StubMapsServer(latency=0) as server, bench.stub_maps(server):
+            bench.seed(hoods=2, members=2, news=3, businesses=2, service_points=4)
+            members = bench.seed(hoods=3, members=1, news=2, businesses=1, service_points=2)
+
+        self.assertEqual(len(members), 3)
+        self.assertEqual(bench.volumes(), {'hoods': 3, 'members': 1, 'news': 2, 'businesses': 1,
+                                           'service_points': 2})
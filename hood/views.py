@@ -1,22 +1,38 @@
 from django.shortcuts import render, redirect, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .forms import SignUpForm, LoginForm, ProfileUpdateForm, NewPostForm, HoodForm
+import csv
+import hashlib
+import itertools
 import json
-import requests
-from .models import Profile, Hood, Location, Business, News
+from datetime import datetime, timedelta
+from .models import Profile, Hood, HoodStats, Location, Business, News, OutgoingEmail, ImageJob
 from django.contrib.sites.shortcuts import get_current_site
 from django.contrib.auth.models import User
 from django.contrib.auth import login
 from django.forms.models import inlineformset_factory
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
+from django.utils.crypto import constant_time_compare
 from django.utils.encoding import force_bytes, force_text
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.template.loader import render_to_string
 from .tokens import account_activation_token
-from googlemaps import Client, convert
 from django.conf import settings
 from .decorators import user_belongs_to_hood
+from django.core.cache import cache
+from django.db import transaction
+from .cache import get_version, bump_version_on_commit
+from .images import rendition_urls
+from . import hub, maps, services as service_points
+from .metrics import render_metrics
 
 
 # Create your views here.
@@ -38,7 +54,7 @@ def signup(request):
                 'uid': urlsafe_base64_encode(force_bytes(user.pk)),
                 'token': account_activation_token.make_token(user),
             })
-            user.email_user(subject, message)
+            OutgoingEmail.queue(subject, message, user.email)
             return redirect('account_activation_sent')
     else:
         form = SignUpForm()
@@ -72,7 +88,7 @@ def activate(request, uidb64, token):
 @login_required
 def select_hood(request):
     form = HoodForm()
-    user = Profile.objects.get(profile_owner=request.user)
+    user = request.profile
     user_has_hood = user.profile_hood
 
     if request.method == 'POST' and 'hood_name' in request.POST is not None:
@@ -88,56 +104,336 @@ def select_hood(request):
 
         return redirect(index)
 
-    return render(request, 'hood/select-hood.html', {'form': form, 'user_has_hood': user_has_hood})
+    hood_directory_url = '{}?v={}'.format(reverse('hood_directory'), get_version('hood-directory', 'all'))
+
+    # the page passes the browser's position back so members can pick from the hoods around them
+    point = parse_point(request.GET)
+    nearby_hoods = Hood.nearby(*point) if point else []
+
+    # sizes come from the maintained counters rather than counting each hood's rows
+    hood_stats = HoodStats.for_hoods([hood['id'] for hood in nearby_hoods] + [user.profile_hood_id])
+    for hood in nearby_hoods:
+        hood['stats'] = hood_stats.get(hood['id'])
+
+    return render(request, 'hood/select-hood.html', {'form': form, 'user_has_hood': user_has_hood,
+                                                     'user_hood_stats': hood_stats.get(user.profile_hood_id),
+                                                     'hood_directory_url': hood_directory_url,
+                                                     'nearby_hoods': nearby_hoods})
+
+
+def parse_point(params):
+    """
+    function that reads valid lat and lng parameters, or returns None
+    """
+    try:
+        lat, lng = float(params['lat']), float(params['lng'])
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+@login_required
+def nearby_hoods(request):
+    """
+    view that returns the hoods closest to ?lat= and ?lng= as json, ?k= sets how many
+    """
+    point = parse_point(request.GET)
+    if point is None:
+        return HttpResponseBadRequest('lat and lng are required')
+    try:
+        k = min(max(int(request.GET.get('k', 5)), 1), 50)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid k')
+    return JsonResponse({'hoods': Hood.nearby(point[0], point[1], k)})
+
+
+def get_hood_directory(request):
+    """
+    function that returns the cached location to hoods map as a (version, json, last modified,
+    hoods by location id) tuple, looked up once per request
+    The first worker to build a version stores it with add(), so every worker answers with the
+    same Last-Modified
+    """
+    if not hasattr(request, '_hood_directory'):
+        version = get_version('hood-directory', 'all')
+        key = 'hood-directory:{}'.format(version)
+        directory = cache.get(key)
+        if directory is None:
+            locations = Hood.directory()
+            directory = (json.dumps({'locations': locations}), timezone.now(),
+                         {str(location['id']): [{'id': hood['id'], 'hood_name': hood['name']}
+                                                for hood in location['hoods']] for location in locations})
+            if not cache.add(key, directory, None):
+                directory = cache.get(key) or directory
+        request._hood_directory = (version,) + directory
+    return request._hood_directory
+
+
+@login_required
+@cache_control(private=True, max_age=settings.HOOD_DIRECTORY_MAX_AGE)
+@condition(etag_func=lambda request: '"{}"'.format(get_hood_directory(request)[0]),
+           last_modified_func=lambda request: get_hood_directory(request)[2])
+def hood_directory(request):
+    """
+    view that returns every location with its hoods as json
+    select-hood links here with the directory version in the url, so browsers can keep the
+    response until a hood is added and fall back to etags otherwise
+    """
+    return HttpResponse(get_hood_directory(request)[1], content_type='application/json')
 
 
 @login_required
 def load_hood(request):
+    hoods = []
     if request.method == "GET" and 'hood_location' in request.GET and request.is_ajax():
         location_id = request.GET.get('hood_location')
-        hoods = Hood.objects.filter(hood_location=location_id)
+        hoods = get_hood_directory(request)[3].get(location_id, [])
     return render(request, 'hood/hood_dropdown.html', {'hoods': hoods})
 
 
+def page_etag(request, *stamps):
+    """
+    function that returns an etag for a page personalised to the request's user
+    Pages with messages waiting to be shown get no etag so they are always rendered
+    """
+    if len(messages.get_messages(request)):
+        return None
+    profile = request.profile
+    parts = (request.user.id, profile.profile_hood_id, profile.profile_photo.name, profile.profile_photo_ready,
+             request.META.get('CSRF_COOKIE'), request.GET.urlencode()) + stamps
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def index_etag(request):
+    hood_id = request.profile.profile_hood_id
+    coordinates = request.profile.profile_hood.hood_location.coordinates
+    # the feed version changes with every post to or deletion from the hood
+    live_services = None
+    if settings.SERVICE_POINTS_LIVE_FALLBACK and coordinates is not None:
+        live_services = maps.nearby_services_stamp(coordinates)
+    return page_etag(request, get_version('hood-feed', hood_id), get_version('service-points', 'all'),
+                     live_services)
+
+
+def all_business_etag(request):
+    return page_etag(request, Business.change_stamp(business_hood=request.profile.profile_hood_id))
+
+
+def manage_business_etag(request):
+    return page_etag(request, Business.change_stamp(business_owner=request.profile.id))
+
+
 @login_required
 @user_belongs_to_hood
+@condition(etag_func=index_etag)
 def index(request):
 
-    google_key = settings.GOOGLE_API
-    geocode_url = settings.GEOCODE_URL
-    gmaps = Client(key=google_key)
+    profile_instance = request.profile
+
+    # locations that couldn't be geocoded show no services until geocode_locations resolves them
+    address = profile_instance.profile_hood.hood_location.coordinates
+
+    services = {'police': {'results': []}, 'hospital': {'results': []}}
+    if address is not None:
+        services = service_points.nearby_services(address)
 
-    profile_instance = Profile.objects.get(id=request.user.id)
-    hood_instance = Hood.objects.filter(hood_name=profile_instance.profile_hood.hood_name)
+    news_feed = render_hood_feed(profile_instance.profile_hood_id)
 
-    place = profile_instance.profile_hood.hood_location.loc_name
+    return render(request, 'index.html', {'news_feed': news_feed,
+                                          'police': services['police'], 'hospitals': services['hospital']})
 
-    place = place.strip().replace(" ", "+")
-    response = requests.get(geocode_url.format(place, google_key))
 
-    general_address = response.json()
-    address = general_address['results'][0]['geometry']['location']
+def render_hood_feed(hood_id):
+    """
+    function that returns the first page of a hood's feed as html, shared by every member of the hood
+    until the hood's news changes
+    """
+    key = 'hood-feed:{}:{}'.format(hood_id, get_version('hood-feed', hood_id))
+    news_feed = cache.get(key)
+    if news_feed is None:
+        hood_news, next_cursor = News.hood_feed(hood_id)
+        news_feed = render_to_string('hood/news-feed.html', {'hood_news': hood_news, 'next_cursor': next_cursor})
+        cache.set(key, news_feed, settings.HOOD_FEED_CACHE_TIMEOUT)
+    return news_feed
 
 
-    nearby_police_results = gmaps.places_nearby(location=address, keyword='police',
-                                                language='en-US', open_now=True,
-                                                rank_by='distance', type='police')
+@login_required
+@user_belongs_to_hood
+def news_feed(request):
+    """
+    view that returns the next page of the hood's news as json for infinite scrolling
+    """
+    profile_instance = request.profile
+    try:
+        hood_news, next_cursor = News.hood_feed(profile_instance.profile_hood_id, request.GET.get('cursor'))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
 
-    nearby_hospital_results = gmaps.places_nearby(location=address, keyword='hospital',
-                                                  language='en-US', open_now=True,
-                                                  rank_by='distance', type='hospital')
+    news = [news_json(item) for item in hood_news]
+    return JsonResponse({'news': news, 'next_cursor': next_cursor})
 
 
-    hood_news = News.objects.filter(news_hood=hood_instance)
+@login_required
+@user_belongs_to_hood
+def news_stream(request):
+    """
+    view that sends members to the news hub with a token for their hood, EventSource reconnects
+    come back here for a fresh one
+    """
+    return redirect(hub.stream_url(request.profile.profile_hood_id))
+
+
+def metrics(request):
+    """
+    view that returns the request metrics of every worker in the prometheus text format
+    """
+    token = settings.METRICS_TOKEN
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token))
+    if not authorized:
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def news_json(news):
+    return {
+        'id': news.id,
+        'details': news.news_details,
+        'footage': news.news_footage.url if news.news_footage else None,
+        'footage_renditions': rendition_urls(news.news_footage),
+        'created_by': str(news.news_created_by),
+        'pub_date': news.news_pub_date.isoformat(),
+    }
+
+
+def business_json(business):
+    return {
+        'id': business.id,
+        'name': business.business_name,
+        'category': business.get_business_category_display(),
+        'description': business.business_description,
+        'email': business.business_email,
+        'owner': str(business.business_owner),
+    }
+
 
-    return render(request, 'index.html', {'hood_news': hood_news,  'police': nearby_police_results, 'hospitals': nearby_hospital_results})
+@login_required
+@user_belongs_to_hood
+def search(request):
+    """
+    view that returns a page of the hood's news or businesses matching ?q= as json, best matches first
+    ?type= is news (the default) or business
+    """
+    terms = request.GET.get('q', '').strip()
+    search_type = request.GET.get('type', 'news')
+    if search_type not in ('news', 'business'):
+        return HttpResponseBadRequest('Invalid search type')
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page')
+
+    results = []
+    next_page = None
+    if terms:
+        hood_id = request.profile.profile_hood_id
+        if search_type == 'news':
+            matches, serialize = News.search(hood_id, terms), news_json
+        else:
+            matches, serialize = Business.search(hood_id, terms), business_json
+
+        page_size = settings.SEARCH_PAGE_SIZE
+        offset = (page - 1) * page_size
+        # one extra row tells whether there is a next page without counting every match
+        results = list(matches[offset:offset + page_size + 1])
+        if len(results) > page_size:
+            results = results[:page_size]
+            next_page = page + 1
+        results = [dict(serialize(result), rank=result.rank) for result in results]
+
+    return JsonResponse({'q': terms, 'type': search_type, 'results': results, 'next_page': next_page})
+
+
+class Echo:
+    """
+    File-like object whose write returns what it is given, so csv rows can be streamed
+    """
+    def write(self, value):
+        return value
+
+
+def parse_export_date(value, days=0):
+    """
+    function that turns a YYYY-MM-DD date into the aware datetime at the start of that day plus days
+    """
+    day = datetime.strptime(value, '%Y-%m-%d') + timedelta(days=days)
+    return timezone.make_aware(day)
+
+
+@login_required
+@user_belongs_to_hood
+def export_news(request):
+    """
+    view that streams the hood's news to its admin as csv or json
+    ?from= and ?to= limit the export to a YYYY-MM-DD range, both inclusive, and ?footage=1 adds
+    footage urls. Rows are read through a server side cursor so memory stays flat for any history.
+    """
+    profile_instance = request.profile
+    hood = profile_instance.profile_hood
+    if hood.hood_admin_id != profile_instance.id:
+        raise PermissionDenied
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'json'):
+        return HttpResponseBadRequest('Invalid format')
+
+    news = News.objects.filter(news_hood=hood.id)
+    try:
+        if request.GET.get('from'):
+            news = news.filter(news_pub_date__gte=parse_export_date(request.GET['from']))
+        if request.GET.get('to'):
+            news = news.filter(news_pub_date__lt=parse_export_date(request.GET['to'], days=1))
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be formatted as YYYY-MM-DD')
+
+    include_footage = request.GET.get('footage') == '1'
+    fields = ['id', 'news_pub_date', 'news_created_by__profile_owner__username', 'news_details']
+    columns = ['id', 'pub_date', 'created_by', 'details']
+    if include_footage:
+        fields.append('news_footage')
+        columns.append('footage')
+    rows = news.order_by('news_pub_date', 'id').values_list(*fields).iterator()
+
+    def records():
+        for row in rows:
+            record = dict(zip(columns, row))
+            record['pub_date'] = record['pub_date'].isoformat()
+            if include_footage:
+                record['footage'] = request.build_absolute_uri(
+                    default_storage.url(record['footage'])) if record['footage'] else ''
+            yield record
+
+    if export_format == 'csv':
+        writer = csv.DictWriter(Echo(), fieldnames=columns)
+        header = writer.writerow(dict(zip(columns, columns)))
+        content = itertools.chain([header], (writer.writerow(record) for record in records()))
+        content_type = 'text/csv'
+    else:
+        content = itertools.chain(['['], (('' if number == 0 else ',') + '\n' + json.dumps(record)
+                                          for number, record in enumerate(records())), ['\n]\n'])
+        content_type = 'application/json'
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="hood-{}-news.{}"'.format(hood.id, export_format)
+    return response
 
 
 @login_required
 def post(request):
-    profile_instance = Profile.objects.get(id=request.user.id)
-    place = profile_instance.profile_hood.pk
-    place = Hood.objects.get(id=place)
+    profile_instance = request.profile
+    place = profile_instance.profile_hood
 
     if request.method == 'POST':
         form = NewPostForm(request.POST, request.FILES)
@@ -146,6 +442,8 @@ def post(request):
             news.news_created_by = profile_instance
             news.news_hood = place
             news.save()
+            ImageJob.queue(news, 'news_footage')
+            transaction.on_commit(lambda: hub.publish(place.id, news_json(news)))
         return redirect(index)
     else:
         form = NewPostForm()
@@ -178,6 +476,11 @@ def profile(request):
                 if formset.is_valid():
                     updated_user.save()
                     formset.save()
+                    for profile_form in formset.forms:
+                        if 'profile_photo' in profile_form.changed_data:
+                            Profile.objects.filter(id=profile_form.instance.id).update(profile_photo_ready=False)
+                            bump_version_on_commit('hood-feed', profile_form.instance.profile_hood_id)
+                            ImageJob.queue(profile_form.instance, 'profile_photo')
                     return redirect(index)
 
     return render(request, 'profile.html', {'profile_data': profile_details, "formset": formset, 'updated_user': update_form})
@@ -191,7 +494,7 @@ def new_location(request):
         hood_name = request.POST.get('hood-name')
         hood_location = request.POST.get('hood-location')
 
-        user_profile = Profile.objects.get(id=request.user.id)
+        user_profile = request.profile
 
         new_location = Location(loc_name=hood_location)
         new_location.save()
@@ -199,7 +502,7 @@ def new_location(request):
         new_hood = Hood(hood_name=hood_name, hood_location=new_location, hood_admin=user_profile)
         new_hood.save()
 
-        user_profile.update_profile_hood(user_profile.id, new_hood)
+        user_profile.update_profile_hood(request.user.id, new_hood)
 
         return redirect('profile')
 
@@ -211,7 +514,7 @@ def new_location(request):
 def new_business(request):
     if request.method == 'POST':
         form = BusinessForm(request.POST)
-        profile_instance = Profile.find_profile_by_userid(request.user.id)
+        profile_instance = request.profile
         profile_instance_hood = profile_instance.profile_hood
         if form.is_valid():
             new_bs = form.save(commit=False)
@@ -240,20 +543,61 @@ def update_business(request, business_id):
 
 @login_required
 @user_belongs_to_hood
+@condition(etag_func=manage_business_etag)
 def manage_business(request):
-    profile_instance = Profile.find_profile_by_userid(request.user.id)
-    businesses = Business.objects.filter(business_owner=profile_instance).all()
+    profile_instance = request.profile
+    businesses = Business.owner_businesses(profile_instance.id)
     return render(request, 'business/manage-business.html', {'businesses': businesses})
 
 
 @login_required
 @user_belongs_to_hood
+@condition(etag_func=all_business_etag)
 def all_business(request):
-    profile_instance = Profile.objects.get(id=request.user.id)
-    hood_instance = Hood.objects.filter(hood_name=profile_instance.profile_hood.hood_name)
+    profile_instance = request.profile
+    hood_id = profile_instance.profile_hood_id
+    facets = get_business_facets(hood_id)
+
+    category = request.GET.get('category')
+    business = Business.hood_businesses(hood_id).order_by('business_name', 'id')
+    if category in dict(Business.BUSINESS_CHOICES):
+        business = business.filter(business_category=category)
+        total = next(facet['count'] for facet in facets if facet['category'] == category)
+    else:
+        category = None
+        total = sum(facet['count'] for facet in facets)
+
+    paginator = Paginator(business, settings.BUSINESS_PAGE_SIZE)
+    # the facets already counted the rows, don't let the paginator count them again
+    paginator.count = total
+    page = paginate(paginator, request.GET.get('page'))
+
+    return render(request, 'business/view-business.html', {'businesses': page, 'facets': facets,
+                                                            'category': category, 'total': total})
+
+
+def paginate(paginator, number):
+    """
+    function that returns a page, falling back to the first or last page for out of range numbers
+    """
+    try:
+        return paginator.page(number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
 
-    business = Business.objects.filter(business_hood=hood_instance)
-    return render(request, 'business/view-business.html', {'businesses': business})
+def get_business_facets(hood_id):
+    """
+    function that returns a hood's cached business counts per category
+    """
+    key = 'hood-business-facets:{}:{}'.format(hood_id, get_version('hood-businesses', hood_id))
+    facets = cache.get(key)
+    if facets is None:
+        facets = Business.category_counts(hood_id)
+        cache.set(key, facets, None)
+    return facets
 
 
 @login_required
@@ -261,7 +605,7 @@ def check_location_exists(request):
     if request.method == 'POST' and request.is_ajax():
         set_hood = request.POST.get('hood-name').strip()
         location_exists = Hood.objects.filter(hood_name__iexact=set_hood).all()
-        user_profile = Profile.find_profile_by_userid(request.user.id)
+        user_profile = request.profile
         user_is_hood_admin = Hood.objects.filter(hood_admin=user_profile)
 
         if location_exists:
@@ -34,6 +34,11 @@ EMAIL_PORT = config('EMAIL_PORT')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 
+# activation emails are queued and sent by `manage.py send_queued_mail`, retry delays are in seconds
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+
 # SECURITY WARNING: don't run with debug turned on in production!
 # DEBUG = config('DEBUG', default=False, cast=bool)
 DEBUG = True
@@ -42,9 +47,56 @@ ALLOWED_HOSTS = ['*']
 LOGIN_REDIRECT_URL = '/'
 LOGIN_URL = ('/login')
 ACCOUNT_ACTIVATION_DAYS = 7
-
-# GOOGLE_API = config('GOOGLE_API')
-# GEOCODE_URL = config('GEOCODE_URL')
+NEWS_FEED_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE = 20
+BUSINESS_PAGE_SIZE = 24
+# nearby hoods are looked up in an in-process grid of HOOD_GRID_CELL_SIZE degree cells
+HOOD_GRID_CELL_SIZE = 0.05
+NEARBY_HOODS_MAX_KM = 50
+
+GOOGLE_API = config('GOOGLE_API', default='')
+GEOCODE_URL = config('GEOCODE_URL', default='https://maps.googleapis.com/maps/api/geocode/json?address={}&key={}')
+GEOCODE_TIMEOUT = config('GEOCODE_TIMEOUT', default=5, cast=float)
+# the geocoder process (geocode_locations --loop) resolves imported locations and retries ones the
+# geocode api couldn't resolve after this many seconds
+GEOCODE_RETRY_AFTER = config('GEOCODE_RETRY_AFTER', default=60 * 60, cast=int)
+
+# cache of nearby police/hospital lookups shared by every member of a hood, in seconds
+NEARBY_CACHE_TTL = config('NEARBY_CACHE_TTL', default=60 * 60 * 6, cast=int)
+NEARBY_CACHE_STALE_TTL = config('NEARBY_CACHE_STALE_TTL', default=60 * 60 * 24, cast=int)
+NEARBY_CACHE_SIZE = config('NEARBY_CACHE_SIZE', default=1024, cast=int)
+# failed lookups are answered with empty results for this long instead of being retried per request
+NEARBY_FAILURE_TTL = config('NEARBY_FAILURE_TTL', default=30, cast=int)
+# uncached lookups run concurrently and the dashboard renders without them past the timeout
+NEARBY_LOOKUP_WORKERS = config('NEARBY_LOOKUP_WORKERS', default=4, cast=int)
+NEARBY_LOOKUP_TIMEOUT = config('NEARBY_LOOKUP_TIMEOUT', default=2, cast=float)
+# dashboards show the SERVICE_POINTS_PER_HOOD closest police stations and hospitals from the local
+# directory filled by refresh_service_points, asking the places api only when this is on
+SERVICE_POINTS_PER_HOOD = 5
+SERVICE_POINTS_MAX_KM = 25
+SERVICE_POINTS_LIVE_FALLBACK = config('SERVICE_POINTS_LIVE_FALLBACK', default=False, cast=bool)
+# the servicepoints process looks every hood up again this often, and hoods without points in reach sooner
+SERVICE_POINTS_REFRESH_SECONDS = config('SERVICE_POINTS_REFRESH_SECONDS', default=60 * 60 * 24 * 7, cast=int)
+
+# run_news_hub streams new posts to members at NEWS_HUB_URL. It takes them from post as postgresql
+# notifications, or over udp at NEWS_HUB_PUBLISH_HOST:PORT from web workers on its host with other databases.
+# Heroku only routes to web processes, so there the hub is the web process of its own app
+NEWS_HUB_URL = config('NEWS_HUB_URL', default='http://localhost:8001/news/stream/')
+NEWS_HUB_PUBLISH_HOST = config('NEWS_HUB_PUBLISH_HOST', default='127.0.0.1')
+NEWS_HUB_PUBLISH_PORT = config('NEWS_HUB_PUBLISH_PORT', default=8002, cast=int)
+NEWS_HUB_PUBLISH_MAX_AGE = 60
+NEWS_HUB_TOKEN_MAX_AGE = 60 * 60
+NEWS_HUB_KEEPALIVE = 15
+NEWS_HUB_QUEUE_SIZE = 100
+NEWS_HUB_BACKLOG = 50
+
+
+# per view metrics are served to prometheus at /metrics/ for staff or with this bearer token,
+# and requests slower than SLOW_REQUEST_SECONDS are logged with their slowest queries
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# every worker adds its metrics to the database this often, so any worker can answer a scrape
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=15, cast=int)
+SLOW_REQUEST_SECONDS = config('SLOW_REQUEST_SECONDS', default=1.0, cast=float)
 
 
 # Application definition
@@ -62,11 +114,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'hood.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'hood.middleware.HoodProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware'
@@ -76,7 +130,7 @@ ROOT_URLCONF = 'neighbour.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'hood.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -109,6 +163,26 @@ DATABASES = {
 DATABASES['default'].update(db_from_env)
 # DATABASES['default'] = dj_database_url.config()
 
+# versioned cache entries are bumped by management commands and every gunicorn worker, so production
+# needs a cache shared between processes with an atomic incr: memcached or redis through CACHE_BACKEND
+# and CACHE_LOCATION. The local memory default only suits a single process and `manage.py check`
+# warns about it (hood.W001)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='neighbour'),
+    }
+}
+# rendered hood feeds are also expired as soon as a hood's news changes
+HOOD_FEED_CACHE_TIMEOUT = 60 * 60
+HOOD_DIRECTORY_MAX_AGE = 60 * 60 * 24
+# sessions are read from the cache and kept in the database so they survive a cache flush, and the
+# auth backend loads the session's user with their profile, hood and location in one cache entry.
+# ModelBackend stays listed so sessions logged in before the cached backend keep working
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['hood.backends.CachedModelBackend', 'django.contrib.auth.backends.ModelBackend']
+REQUEST_PROFILE_CACHE_TIMEOUT = 60 * 5
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -157,4 +231,12 @@ STATICFILES_STORAGE = 'whitenoise.django.GzipManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-MEDIA_DIR= os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_DIR= os.path.join(BASE_DIR, 'media')
+
+# uploads are capped to IMAGE_MAX_DIMENSION pixels and get jpeg and webp renditions at each width
+IMAGE_MAX_DIMENSION = 1600
+IMAGE_RENDITION_WIDTHS = (320, 640, 1280)
+IMAGE_QUALITY = 82
+# uploads are processed by `manage.py process_image_jobs`, jobs running longer than the timeout are retried
+IMAGE_JOB_TIMEOUT = 60 * 10
+IMAGE_JOB_MAX_ATTEMPTS = 3
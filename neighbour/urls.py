@@ -29,5 +29,12 @@ urlpatterns = [
         app_views.activate, name='activate'),
     url(r'^signup/$', app_views.signup, name='signup'),
     url(r'^logout/$', views.logout, {'next_page': 'login'}, name='logout'),
+    url(r'^news/feed/$', app_views.news_feed, name='news_feed'),
+    url(r'^news/export/$', app_views.export_news, name='export_news'),
+    url(r'^news/stream/$', app_views.news_stream, name='news_stream'),
+    url(r'^hoods/directory/$', app_views.hood_directory, name='hood_directory'),
+    url(r'^hoods/nearby/$', app_views.nearby_hoods, name='nearby_hoods'),
+    url(r'^search/$', app_views.search, name='search'),
+    url(r'^metrics/$', app_views.metrics, name='metrics'),
     # url(r'^tinymce/', include('tinymce.urls')),
 ]
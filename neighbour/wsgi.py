@@ -15,4 +15,8 @@ from whitenoise.django import DjangoWhiteNoise
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "neighbour.settings")
 
 application = get_wsgi_application()
-application = DjangoWhiteNoise(application)
\ No newline at end of file
+application = DjangoWhiteNoise(application)
+
+from hood.metrics import flush_in_background  # noqa: E402
+
+flush_in_background()
\ No newline at end of file